@@ -0,0 +1,140 @@
+import math
+import numpy as np
+
+
+''' <summary>
+	Ant colony optimization (MAX-MIN Ant System) with the pheromone and heuristic
+	as (n, n) arrays.  All the ants of an iteration build their tours in lockstep:
+	at every step each ant's next city is drawn with probability proportional to
+	pheromone**alpha * (1/cost)**beta of the edges out of its current city, over
+	the cities it has not been to and can get to; missing edges (Hard) never get
+	picked.  An ant with nowhere left to go carries on through a missing edge so
+	the arrays stay in step, and its tour just does not count.
+
+	After every iteration the pheromone evaporates and the iteration's best ant
+	lays pheromone on its edges, with every level kept between tau_min and tau_max
+	so the search never settles on one tour for good.  The (n, n) arrays are
+	worked on a block of rows at a time, checking the deadline in between, and
+	ants still on their way when the deadline passes finish their tours through
+	the cities they have not been to in index order, so the last iteration's
+	tours are not lost.
+	</summary> '''
+
+
+ANTS = 20
+# weight of the pheromone and of the heuristic (1/cost) in the choice of the next city
+ALPHA = 1.0
+BETA = 3.0
+# fraction of the pheromone that evaporates every iteration
+EVAPORATION = 0.1
+# entries of an (n, n) array worked on together between deadline checks
+ROW_BLOCK_SIZE = 2**18
+
+
+# the cost of every tour (one per row), np.inf for ones with a missing edge
+def tour_costs( tours, cost_matrix ):
+	return cost_matrix[tours, np.roll(tours, -1, axis=1)].sum(axis=1)
+
+
+# function(first, last) for row blocks first:last of an (n, n) array, None if the deadline passed first
+def by_rows( n, function, deadline ):
+	rows = max(1, ROW_BLOCK_SIZE // max(n, 1))
+	for first in range(0, n, rows):
+		if deadline.expired():
+			return None
+		function(first, min(first + rows, n))
+	return True
+
+
+# (1/cost)**beta of every edge, 0 for missing ones, None if the deadline passed first
+def heuristic_weights( cost_matrix, beta, deadline ):
+	heuristic = np.empty(cost_matrix.shape)
+	def fill( first, last ):
+		costs = cost_matrix[first:last]
+		edges = costs != math.inf
+		heuristic[first:last] = np.where(edges, 1.0 / np.maximum(np.where(edges, costs, 1.0), 1.0), 0.0) ** beta
+	return heuristic if by_rows(len(cost_matrix), fill, deadline) else None
+
+
+# pheromone**alpha * heuristic of every edge, None if the deadline passed first
+def edge_weights( pheromone, alpha, heuristic, deadline ):
+	weights = np.empty(pheromone.shape)
+	def fill( first, last ):
+		np.multiply(pheromone[first:last] ** alpha, heuristic[first:last], out=weights[first:last])
+	return weights if by_rows(len(pheromone), fill, deadline) else None
+
+
+# Build one tour per ant from random start cities, drawing from weights (n, n) of the edges that exist.
+# Returns the tours as an (ants, n) array and whether the ants got to the end; if the deadline passed
+# first, the ants go on to the cities they have not been to in index order, so their tours are complete.
+def construct_tours( weights, ants, deadline ):
+	n = len(weights)
+	tours = np.empty((ants, n), dtype=int)
+	tours[:, 0] = np.random.randint(n, size=ants)
+	visited = np.zeros((ants, n), dtype=bool)
+	ant = np.arange(ants)
+	visited[ant, tours[:, 0]] = True
+	for step in range(1, n):
+		if deadline.expired():
+			# every ant has n - step cities left, the False entries of its row sorted first
+			tours[:, step:] = np.argsort(visited, axis=1, kind='stable')[:, :n - step]
+			return tours, False
+		choices = weights[tours[:, step - 1]] * ~visited
+		# stuck ants go anywhere they have not been
+		stuck = choices.sum(axis=1) == 0
+		choices[stuck] = ~visited[stuck]
+		cumulative = np.cumsum(choices, axis=1)
+		# the first city whose cumulative weight reaches a point in (0, total], which has a weight above 0
+		points = (1.0 - np.random.random_sample(ants)) * cumulative[:, -1]
+		next_cities = np.minimum((cumulative < points[:, None]).sum(axis=1), n - 1)
+		tours[:, step] = next_cities
+		visited[ant, next_cities] = True
+	return tours, True
+
+
+# Run the colony until the deadline passes or max_iterations have gone by, starting from best_route
+# (if given) as the best tour so far.  The tours of an iteration cut short by the deadline still count.
+# Returns (improvements of the best tour, iterations, best tour or None, its cost).
+def ant_colony( cost_matrix, deadline, ants=ANTS, alpha=ALPHA, beta=BETA, evaporation=EVAPORATION,
+				max_iterations=None, best_route=None ):
+	n = len(cost_matrix)
+	improvements = 0
+	iterations = 0
+	best_cost = tour_costs(best_route[None, :], cost_matrix)[0] if best_route is not None else math.inf
+	if n < 2 or deadline.passed():
+		return improvements, iterations, best_route, best_cost
+	if best_cost < math.inf:
+		tau_max = 1.0 / (evaporation * best_cost)
+	else:
+		# start at tau_max for a tour about as long as every city's cheapest edge out
+		cheapest = cost_matrix.min(axis=1)
+		tau_max = 1.0 / (evaporation * max(cheapest[cheapest != math.inf].sum(), 1.0))
+	tau_min = tau_max / (2 * n)
+	heuristic = heuristic_weights(cost_matrix, beta, deadline)
+	if heuristic is None:
+		return improvements, iterations, best_route, best_cost
+	pheromone = np.full((n, n), tau_max)
+	while not deadline.expired() and (max_iterations is None or iterations < max_iterations):
+		weights = edge_weights(pheromone, alpha, heuristic, deadline)
+		if weights is None:
+			break
+		tours, finished = construct_tours(weights, ants, deadline)
+		costs = tour_costs(tours, cost_matrix)
+		best_ant = int(np.argmin(costs))
+		if costs[best_ant] < best_cost:
+			best_cost = costs[best_ant]
+			best_route = tours[best_ant].copy()
+			improvements += 1
+			deadline.record(int(best_cost), best_route)
+			tau_max = 1.0 / (evaporation * best_cost)
+			tau_min = tau_max / (2 * n)
+		if not finished:
+			break
+		iterations += 1
+
+		pheromone *= 1.0 - evaporation
+		if costs[best_ant] < math.inf:
+			tour = tours[best_ant]
+			pheromone[tour, np.roll(tour, -1)] += 1.0 / costs[best_ant]
+		np.clip(pheromone, tau_min, tau_max, out=pheromone)
+	return improvements, iterations, best_route, best_cost
@@ -0,0 +1,205 @@
+import math
+import numpy as np
+
+
+''' <summary>
+	Lower bound strategies for branch-and-bound.  Every State already carries the
+	reduced cost matrix bound in state.lower_bound; a strategy's tighten() may raise
+	state.bound above it.  The reduced matrix stays consistent with lower_bound
+	(cost of any completion = lower_bound + reduced costs of its edges), which is
+	what lets the stronger bounds below build on it.
+	</summary> '''
+
+
+# the reduced cost matrix bound computed by State itself
+class ReducedCostBound:
+
+	name = 'reduced'
+
+	def __init__( self, cost_matrix ):
+		pass
+
+	def tighten( self, state, bssf_cost ):
+		pass
+
+
+# the assignment problem (Hungarian) bound for the asymmetric costs: the rows and columns
+# still in play are reduced by optimal assignment duals instead of just their minimums.
+# With symmetric costs the optimal assignment is mostly 2-cycles (i->j->i), which is hardly
+# better than the reduced matrix bound, so there OneTreeBound is the one to use
+class AssignmentBound( ReducedCostBound ):
+
+	name = 'assignment'
+
+	def tighten( self, state, bssf_cost ):
+		rows = np.flatnonzero(state.unvisited_rows())
+		columns = np.flatnonzero(state.unvisited_columns())
+		submatrix = state.matrix[np.ix_(rows, columns)]
+		cost, row_duals, column_duals = solve_assignment(submatrix)
+		if cost == math.inf:
+			state.lower_bound = math.inf
+			state.bound = math.inf
+			return
+		# reduced costs stay >= 0 and every row and column keeps a zero on its assigned edge,
+		# so child states can keep reducing incrementally from here
+		state.matrix[np.ix_(rows, columns)] = submatrix - row_duals[:, np.newaxis] - column_duals[np.newaxis, :]
+		state.count_zeros()
+		state.lower_bound += float(cost)
+		state.bound = state.lower_bound
+
+
+# Held-Karp style bound: the rest of the tour is a path from the current city through the
+# unvisited cities back to the start.  Contracting the route so far into one node, that path
+# is a cycle, whose reduced cost is at least the minimum 1-tree over the cheaper direction of
+# every edge.  Lagrangian penalties on the cities (learned at the root with subgradient steps)
+# push the 1-tree towards a tour.
+class OneTreeBound( ReducedCostBound ):
+
+	name = 'one_tree'
+
+	ROOT_ITERATIONS = 100
+	CHILD_ITERATIONS = 3
+
+	def __init__( self, cost_matrix ):
+		super().__init__(cost_matrix)
+		self._penalties = np.zeros(len(cost_matrix))
+		self._root_done = False
+
+	def tighten( self, state, bssf_cost ):
+		if state.lower_bound == math.inf:
+			state.bound = math.inf
+			return
+		unvisited = np.flatnonzero(~state.visited)
+		# node 0 is the route so far: leaving it is leaving the current city, entering it is entering the start
+		row_ids = np.concatenate(([state.to_index], unvisited))
+		column_ids = np.concatenate(([state.start_index], unvisited))
+		reduced = state.matrix[np.ix_(row_ids, column_ids)]
+		if len(unvisited) < 2:
+			# at most one city left, the completion is fixed
+			completion = reduced[0, 0] if len(unvisited) == 0 else reduced[0, 1] + reduced[1, 0]
+			state.bound = state.lower_bound + float(completion)
+			return
+		reduced[0, 0] = math.inf
+		weights = np.minimum(reduced, reduced.T)
+
+		penalties = self._penalties[row_ids].copy()
+		penalties[0] = 0.0
+		iterations = self.CHILD_ITERATIONS if self._root_done else self.ROOT_ITERATIONS
+		best = self._subgradient(weights, penalties, iterations, bssf_cost - state.lower_bound)
+		if not self._root_done:
+			self._penalties[unvisited] = penalties[1:]
+			self._root_done = True
+		state.bound = max(state.lower_bound, state.lower_bound + float(best))
+
+	# maximize the Lagrangian 1-tree bound over the penalties (updated in place), returning the best bound
+	def _subgradient( self, weights, penalties, iterations, upper_bound ):
+		best = -math.inf
+		step_scale = 2.0
+		for iteration in range(max(1, iterations)):
+			tree_cost, degrees = minimum_one_tree(weights + penalties[:, np.newaxis] + penalties[np.newaxis, :])
+			if tree_cost == math.inf:
+				return math.inf
+			value = tree_cost - 2 * penalties.sum()
+			best = max(best, value)
+			subgradient = degrees - 2
+			norm = (subgradient ** 2).sum()
+			# every degree is 2, the 1-tree is a tour and the bound cannot improve
+			if norm == 0:
+				break
+			if upper_bound == math.inf or upper_bound <= value:
+				step = 0.01 * np.mean(weights[np.isfinite(weights)])
+			else:
+				step = step_scale * (upper_bound - value) / norm
+			penalties += step * subgradient
+			penalties[0] = 0.0
+			step_scale *= 0.95
+		return best
+
+
+# name of every bound strategy for branchAndBound's bound argument
+BOUNDS = { strategy.name: strategy for strategy in (ReducedCostBound, AssignmentBound, OneTreeBound) }
+
+
+# minimum cost perfect assignment of a square matrix (np.inf = forbidden) by the Hungarian method,
+# returning the cost and row / column duals with row_duals[i] + column_duals[j] <= matrix[i,j]
+# that add up to it.  The cost is np.inf when no assignment avoids the forbidden entries.
+# Time O(k^3), with the innermost loop vectorized
+def solve_assignment( matrix ):
+	k = len(matrix)
+	finite = np.isfinite(matrix)
+	# stand-in for forbidden entries that no finite assignment can reach
+	forbidden = (matrix[finite].max() + 1.0) * k + 1.0 if finite.any() else 1.0
+	costs = np.where(finite, matrix, forbidden)
+
+	# 1-based like the textbook version, row / column 0 are dummies
+	u = np.zeros(k + 1)
+	v = np.zeros(k + 1)
+	assigned_row = np.zeros(k + 1, dtype=int)	# assigned_row[j] = row assigned to column j
+	way = np.zeros(k + 1, dtype=int)
+	for i in range(1, k + 1):
+		assigned_row[0] = i
+		j0 = 0
+		minimums = np.full(k + 1, math.inf)
+		used = np.zeros(k + 1, dtype=bool)
+		while True:
+			used[j0] = True
+			i0 = assigned_row[j0]
+			free = ~used[1:]
+			current = costs[i0 - 1] - u[i0] - v[1:]
+			better = free & (current < minimums[1:])
+			minimums[1:][better] = current[better]
+			way[1:][better] = j0
+			candidates = np.where(free, minimums[1:], math.inf)
+			j1 = int(np.argmin(candidates)) + 1
+			delta = candidates[j1 - 1]
+			used_columns = np.flatnonzero(used)
+			u[assigned_row[used_columns]] += delta
+			v[used_columns] -= delta
+			minimums[1:][free] -= delta
+			j0 = j1
+			if assigned_row[j0] == 0:
+				break
+		# flip the augmenting path
+		while j0 != 0:
+			j1 = way[j0]
+			assigned_row[j0] = assigned_row[j1]
+			j0 = j1
+
+	cost = costs[assigned_row[1:] - 1, np.arange(k)].sum()
+	if cost >= forbidden:
+		return math.inf, None, None
+	return cost, u[1:], v[1:]
+
+
+# minimum 1-tree of a symmetric weight matrix: a spanning tree of nodes 1.. plus the two cheapest
+# edges from node 0.  Returns its cost and the degree of every node, cost np.inf if there is none.
+# Time O(k^2), with k vectorized steps of Prim's algorithm
+def minimum_one_tree( weights ):
+	k = len(weights)
+	degrees = np.zeros(k, dtype=int)
+	in_tree = np.zeros(k, dtype=bool)
+	in_tree[0] = True
+	in_tree[1] = True
+	distance = weights[1].copy()
+	closest = np.ones(k, dtype=int)
+	total = 0.0
+	for _ in range(k - 2):
+		candidates = np.where(in_tree, math.inf, distance)
+		j = int(np.argmin(candidates))
+		if candidates[j] == math.inf:
+			return math.inf, degrees
+		total += candidates[j]
+		in_tree[j] = True
+		degrees[j] += 1
+		degrees[closest[j]] += 1
+		closer = weights[j] < distance
+		distance = np.where(closer, weights[j], distance)
+		closest = np.where(closer, j, closest)
+
+	edges = np.argpartition(weights[0, 1:], 1)[:2] + 1
+	if not np.isfinite(weights[0, edges]).all():
+		return math.inf, degrees
+	total += weights[0, edges].sum()
+	degrees[0] = 2
+	degrees[edges] += 1
+	return total, degrees
@@ -0,0 +1,82 @@
+import math
+import time
+
+
+''' <summary>
+	Time budget of one solver run.  expired() is meant to be called from inner
+	loops, so it only reads the clock every so many calls, spacing the reads about
+	CHECK_INTERVAL seconds apart however long an iteration takes.  The run's
+	anytime trace is kept here too: record() notes the elapsed time whenever a
+	better solution is found.
+
+	Setting cancel_event (a threading.Event) ends the run early, as if time was up,
+	and on_record(cost, route) is called for every better solution, route being
+	the city indices of the tour (only valid during the call, copy it to keep it).
+	</summary> '''
+
+class Deadline:
+
+	# seconds between clock reads, which is also about how far past the deadline a run can go
+	CHECK_INTERVAL = 0.001
+	# never go longer than this many calls without reading the clock
+	MAX_STRIDE = 2**16
+
+	def __init__( self, start_time, time_allowance, cancel_event=None, on_record=None ):
+		self.start_time = start_time
+		self.end_time = start_time + time_allowance
+		self.cancel_event = cancel_event
+		self.on_record = on_record
+		# (elapsed seconds, cost) for every improvement of the best solution so far
+		self.trace = []
+		self._stride = 1
+		self._countdown = 1
+		self._last_check = start_time
+		self._expired = False
+
+	def expired( self ):
+		if self._expired:
+			return True
+		self._countdown -= 1
+		if self._countdown > 0:
+			return False
+		now = time.time()
+		if now >= self.end_time or (self.cancel_event is not None and self.cancel_event.is_set()):
+			self._expired = True
+			return True
+		# read the clock more or less often until the reads are about CHECK_INTERVAL apart
+		since = now - self._last_check
+		if since < self.CHECK_INTERVAL / 2:
+			self._stride = min(self._stride * 2, self.MAX_STRIDE)
+		elif since > self.CHECK_INTERVAL * 2:
+			self._stride = max(self._stride // 2, 1)
+		self._last_check = now
+		self._countdown = self._stride
+		return False
+
+	# like expired(), but always reads the clock; for loops that only come around now and then
+	def passed( self ):
+		self._countdown = 1
+		return self.expired()
+
+	def elapsed( self ):
+		return time.time() - self.start_time
+
+	def remaining( self ):
+		return max(0.0, self.end_time - time.time())
+
+	# note a new solution, if it beats everything recorded so far
+	def record( self, cost, route=None ):
+		if cost == math.inf or (len(self.trace) != 0 and cost >= self.trace[-1][1]):
+			return
+		self.trace.append((self.elapsed(), cost))
+		if self.on_record is not None:
+			self.on_record(cost, route)
+
+
+# combine the traces of runs that share a start time into one trace of the best cost over time
+def merge_traces( traces ):
+	merged = []
+	for elapsed, cost in sorted(entry for trace in traces for entry in trace):
+		if len(merged) == 0 or cost < merged[-1][1]:
+			merged.append((elapsed, cost))
+	return merged
@@ -0,0 +1,155 @@
+import math
+import numpy as np
+
+
+''' <summary>
+	Genetic algorithm over a population stored as a 2D array, one permutation of
+	the city indices per row.  A whole generation is scored, selected, crossed over
+	and mutated with array operations: the cost of every tour is one gather of its
+	edges from the cost matrix and a sum along the rows.  Missing edges (np.inf)
+	are counted with a penalty instead, larger than any complete tour costs, so
+	that incomplete tours still rank by how many edges they are missing and the
+	population can work its way towards complete ones.
+	</summary> '''
+
+
+POPULATION_SIZE = 100
+# the best individuals copied to the next generation unchanged
+ELITE = 2
+# individuals taking part in every tournament for a parent
+TOURNAMENT_SIZE = 3
+# chance of a child being mutated
+MUTATION_RATE = 0.3
+# entries of the cost matrix (or edges of the population) looked at together between deadline checks
+BLOCK_SIZE = 2**16
+
+
+# the cost of every tour in the population, np.inf for ones with a missing edge
+def tour_costs( population, cost_matrix ):
+	return cost_matrix[population, np.roll(population, -1, axis=1)].sum(axis=1)
+
+# the cost of every tour with every missing edge costing penalty instead
+def penalized_costs( population, cost_matrix, penalty ):
+	edges = cost_matrix[population, np.roll(population, -1, axis=1)]
+	return np.where(edges == math.inf, penalty, edges).sum(axis=1)
+
+
+# the cost of every tour in the population, np.inf for ones with a missing edge and np.nan for the
+# ones not scored before the deadline passed
+def scored_costs( population, cost_matrix, deadline ):
+	count, n = population.shape
+	rows = max(1, BLOCK_SIZE // max(n, 1))
+	costs = np.full(count, np.nan)
+	for first in range(0, count, rows):
+		costs[first:first + rows] = tour_costs(population[first:first + rows], cost_matrix)
+		if deadline.expired():
+			break
+	return costs
+
+# more than a complete tour can cost, None if the deadline passed first
+def missing_edge_penalty( cost_matrix, deadline ):
+	n = len(cost_matrix)
+	rows = max(1, BLOCK_SIZE // max(n, 1))
+	highest = 1.0
+	for first in range(0, n, rows):
+		if deadline.expired():
+			return None
+		block = cost_matrix[first:first + rows]
+		highest = max(highest, np.max(block, where=block != math.inf, initial=0.0))
+	return highest * n + 1.0
+
+
+# count random permutations of n cities
+def random_permutations( count, n ):
+	return np.argsort(np.random.random_sample((count, n)), axis=1)
+
+
+# indices of the winners of count tournaments among TOURNAMENT_SIZE random individuals, lowest fitness wins
+def tournament( fitness, count, size=TOURNAMENT_SIZE ):
+	entrants = np.random.randint(len(fitness), size=(count, size))
+	return entrants[np.arange(count), np.argmin(fitness[entrants], axis=1)]
+
+
+# Order crossover (OX1), one child for every row of first and second parents: the child keeps a random
+# stretch of its first parent in place, and the rest of the cities follow in the order they have in
+# the second parent, starting after the stretch.
+def order_crossover( first, second ):
+	count, n = first.shape
+	rows = np.arange(count)[:, None]
+	cuts = np.sort(np.random.randint(n + 1, size=(count, 2)), axis=1)
+	start, end = cuts[:, :1], cuts[:, 1:]
+	columns = np.arange(n)[None, :]
+	kept = (columns >= start) & (columns < end)
+	# which cities each child already has from its first parent
+	has = np.zeros((count, n), dtype=bool)
+	has[np.broadcast_to(rows, (count, n))[kept], first[kept]] = True
+	# the second parent read from the end of the stretch around, without the cities the child has
+	after = (end + columns) % n
+	others = second[rows, after]
+	order = np.argsort(has[rows, others], axis=1, kind='stable')
+	others = np.take_along_axis(others, order, axis=1)
+	children = first.copy()
+	fill = columns < n - (end - start)
+	children[np.broadcast_to(rows, (count, n))[fill], after[fill]] = others[fill]
+	return children
+
+
+# Mutate each row with the given chance, half of them by reversing a random stretch and half by
+# moving one city to another place.  Both are done as a map of new positions for every row.
+def mutate( population, rate=MUTATION_RATE ):
+	count, n = population.shape
+	columns = np.arange(n)[None, :]
+	cuts = np.sort(np.random.randint(n, size=(count, 2)), axis=1)
+	a, b = cuts[:, :1], cuts[:, 1:]
+	inside = (columns >= a) & (columns <= b)
+	# reversal: positions a..b are read backwards
+	reversal = np.where(inside, a + b - columns, columns)
+	# move the city at a to b: positions a..b-1 are read one further on, and b reads a
+	moved = np.where(inside, columns + 1, columns)
+	moved = np.where(columns == b, a, moved)
+	source = np.where(np.random.random_sample((count, 1)) < 0.5, reversal, moved)
+	source = np.where(np.random.random_sample((count, 1)) < rate, source, columns)
+	return np.take_along_axis(population, source, axis=1)
+
+
+# Evolve the population (modified in place) until the deadline passes or max_generations have gone by.
+# Returns (improvements of the best complete tour, generations, best tour or None, its cost).
+def evolve( population, cost_matrix, deadline, max_generations=None, elite=ELITE, mutation_rate=MUTATION_RATE ):
+	count, n = population.shape
+	# worked out after the first generation is scored
+	penalty = None
+	elite = min(elite, count)
+	improvements = 0
+	generations = 0
+	best_route = None
+	best_cost = math.inf
+	while True:
+		# the first rows are scored even if the deadline has passed
+		costs = scored_costs(population, cost_matrix, deadline)
+		fittest = int(np.nanargmin(costs)) if not np.isnan(costs).all() else 0
+		if costs[fittest] < best_cost:
+			best_cost = costs[fittest]
+			best_route = population[fittest].copy()
+			improvements += 1
+			deadline.record(int(best_cost), best_route)
+		if deadline.passed() or (max_generations is not None and generations >= max_generations):
+			break
+		if penalty is None:
+			penalty = missing_edge_penalty(cost_matrix, deadline)
+			if penalty is None:
+				break
+
+		fitness = penalized_costs(population, cost_matrix, penalty)
+		elites = population[np.argsort(fitness, kind='stable')[:elite]]
+		first = population[tournament(fitness, count - elite)]
+		second = population[tournament(fitness, count - elite)]
+		# a generation of a big population takes a while, so look at the clock between its steps too
+		if deadline.passed():
+			break
+		children = order_crossover(first, second)
+		if deadline.passed():
+			break
+		children = mutate(children, mutation_rate)
+		population[:] = np.concatenate((elites, children))
+		generations += 1
+	return improvements, generations, best_route, best_cost
@@ -0,0 +1,153 @@
+import math
+import random
+import numpy as np
+from LocalSearch import search, best_chain_move, best_segment_insertion
+
+
+''' <summary>
+	Lin-Kernighan style variable-depth search on a LocalSearch.Tour.  A chain starts
+	by breaking the edge out of a city t1 and keeps t1 in place: every step is a
+	2-opt move that adds an edge t2->t3 from the neighbor list of t2 (t1's successor
+	right now) and leaves t1 with a new successor t4, the city before t3.  The chain
+	goes on as long as the open path (the tour without the edge out of t1) is
+	cheaper than the tour we started with, even when the closed tour is worse, and
+	the best closed tour seen along the way is kept.  Every step is scored exactly
+	from the tour's prefix sums, so asymmetric costs and missing edges are handled
+	the same as symmetric ones.
+
+	The chains are run together with the Or-opt and segment insertion moves of
+	LocalSearch, and once nothing improves, a random double bridge kick is made to
+	get out of the local optimum (iterated Lin-Kernighan).
+	</summary> '''
+
+
+# how many steps a chain can take
+MAX_DEPTH = 10
+# the stretches swapped by a kick are at most this many cities long
+KICK_SPAN = 50
+# random places tried for a kick before giving up on it
+KICK_ATTEMPTS = 100
+
+
+# the best improving (delta, move) found by a chain from t1, None if there is none
+def best_chain( tour, neighbors, max_depth, t1 ):
+	n = len(tour.route)
+	if n < 5:
+		return None
+	cost = tour.cost_matrix
+	# the steps as positions j of reversals 1..j with t1 rotated to the front (see LocalSearch.apply_move),
+	# and the cities t2 t4 t3 of each
+	reversals = []
+	touched = [t1]
+	added = set()
+	# what was done to the tour, to undo: ('reverse', i, j) or ('rotate', the city that was first)
+	undo = []
+	total = 0.0
+	best_total = 0.0
+	best_depth = 0
+	for depth in range(max_depth):
+		route = tour.route
+		p = tour.position[t1]
+		t2 = route[(p + 1) % n]
+		best_gain = 0.0
+		best_step = None
+		for t3 in neighbors[t2]:
+			if t3 < 0:
+				break
+			# an edge added by the chain is never taken out again
+			if t3 in added:
+				continue
+			# how far t3 comes after t1
+			r = (tour.position[t3] - p) % n
+			if r < 3:
+				continue
+			# ... t1 [t2 ... t4] t3 ... becomes ... t1 t4 ... t2 t3 ...
+			# the stretch is scored where it is, wrapping around the end of the route or not
+			delta = tour.cyclic_reversal_delta((p + 1) % n, (p + r - 1) % n)
+			if delta == math.inf:
+				continue
+			# gain of the open path t4 ... t1, without the edge t1->t4
+			gain = cost[t1, route[(p + r - 1) % n]] - (total + delta)
+			if gain > best_gain:
+				best_gain, best_step = gain, (r - 1, delta, t3)
+		if best_step is None:
+			break
+		j, delta, t3 = best_step
+		touched += [t2, route[(p + j) % n], t3]
+		if p + j >= n:
+			# the stretch wraps around, rotate t1 to the front so it does not
+			undo.append(('rotate', route[0]))
+			tour.rotate_to_front(t1)
+			p = 0
+		tour.reverse(p + 1, p + j)
+		undo.append(('reverse', p + 1, p + j))
+		reversals.append(j)
+		added.add(t3)
+		total += delta
+		if total < best_total:
+			best_total, best_depth = total, len(reversals)
+
+	# undo the chain, the search makes the best part of it again if it is chosen
+	for step in reversed(undo):
+		if step[0] == 'reverse':
+			tour.reverse(step[1], step[2])
+		else:
+			tour.rotate_to_front(step[1])
+	if best_depth == 0:
+		return None
+	return best_total, ('reversals', t1, reversals[:best_depth], touched[:1 + 3 * best_depth])
+
+
+# Swap three neighboring stretches of random lengths at a random place,
+# ... a [b ... c] [d ... e] [f ... g] h ... becomes ... a f ... g d ... e b ... c h ...
+# which changes four edges in a way 2-opt and 3-opt chains hardly ever undo.  Only kicks whose new
+# edges all exist are made, trying up to attempts places.
+# Returns the cities whose edges changed, None if no kick was made.
+def double_bridge( tour, span=KICK_SPAN, attempts=KICK_ATTEMPTS ):
+	route = tour.route
+	cost = tour.cost_matrix
+	n = len(route)
+	longest = max(1, min(span, (n - 1) // 3))
+	for attempt in range(attempts):
+		lengths = [random.randint(1, longest) for stretch in range(3)]
+		i = random.randint(1, n - sum(lengths))
+		j = i + lengths[0]
+		k = j + lengths[1]
+		l = k + lengths[2]
+		a, b, c, d = route[i - 1], route[i], route[j - 1], route[j]
+		e, f, g, h = route[k - 1], route[k], route[l - 1], route[l % n]
+		if cost[a, f] + cost[g, d] + cost[e, b] + cost[c, h] == math.inf:
+			continue
+		tour.set_route(np.concatenate((route[:i], route[k:l], route[j:k], route[i:j], route[l:])))
+		return [a, b, c, d, e, f, g, h]
+	return None
+
+
+# Iterated Lin-Kernighan: search with chains, Or-opt and segment insertion moves until nothing
+# improves, then kick the best tour so far and search again from the cities the kick touched,
+# keeping the result if it is no worse, until the deadline passes (or max_kicks kicks).
+# tour ends up as the best tour found.  Returns (improving moves and kicks, kicks made).
+def iterated_lin_kernighan( tour, neighbors, incoming, deadline, max_depth=MAX_DEPTH, max_length=3,
+							inner_neighbors=5, kick_span=KICK_SPAN, max_kicks=None ):
+	finders = [lambda a: best_chain(tour, neighbors, max_depth, a),
+			   lambda a: best_chain_move(tour, neighbors, incoming, max_length, a),
+			   lambda a: best_segment_insertion(tour, neighbors, inner_neighbors, a)]
+	improvements = search(tour, deadline, finders)
+	best_route = tour.route.copy()
+	best_cost = tour.cost
+	kicks = 0
+	# a kick needs three stretches besides the first city
+	while len(tour.route) >= 4 and (max_kicks is None or kicks < max_kicks) and not deadline.passed():
+		touched = double_bridge(tour, kick_span)
+		if touched is None:
+			break
+		kicks += 1
+		search(tour, deadline, finders, touched)
+		if tour.cost <= best_cost:
+			if tour.cost < best_cost:
+				improvements += 1
+			best_route = tour.route.copy()
+			best_cost = tour.cost
+		else:
+			tour.set_route(best_route)
+	return improvements, kicks
@@ -0,0 +1,279 @@
+import math
+import time
+from collections import deque
+import numpy as np
+from Deadline import Deadline
+
+
+''' <summary>
+	Local search on a tour stored as an array of city indices.  Moves are scored by
+	how much they change the tour cost (their delta) without building a TSPSolution,
+	which is only done once the search is over.
+	</summary> '''
+
+
+# the k cheapest cities to travel to from every city (fewer if a city has fewer edges),
+# padded with -1
+def neighbor_lists( cost_matrix, k ):
+	k = min(k, len(cost_matrix) - 1)
+	if k <= 0:
+		return np.full((len(cost_matrix), 0), -1, dtype=int)
+	nearest = np.argpartition(cost_matrix, k - 1, axis=1)[:, :k]
+	nearest_costs = np.take_along_axis(cost_matrix, nearest, axis=1)
+	order = np.argsort(nearest_costs, axis=1, kind='stable')
+	nearest = np.take_along_axis(nearest, order, axis=1)
+	nearest[np.take_along_axis(nearest_costs, order, axis=1) == math.inf] = -1
+	return nearest
+
+
+class Tour:
+
+	def __init__( self, route, cost_matrix ):
+		self.cost_matrix = cost_matrix
+		self.route = np.array(route, dtype=int)
+		self.position = np.empty(len(self.route), dtype=int)
+		self._update()
+
+	# positions of the cities and prefix sums of the edge costs along the route, in both directions,
+	# so that reversing any stretch of the route can be scored in O(1) even with asymmetric costs
+	# Time O(n)
+	def _update( self ):
+		route = self.route
+		self.position[route] = np.arange(len(route))
+		forward = self.cost_matrix[route[:-1], route[1:]]
+		backward = self.cost_matrix[route[1:], route[:-1]]
+		self._forward = np.concatenate(([0.0], np.cumsum(forward)))
+		# the way back may be missing edges, count them separately so the sums stay finite
+		backward_missing = backward == math.inf
+		self._backward = np.concatenate(([0.0], np.cumsum(np.where(backward_missing, 0.0, backward))))
+		self._backward_missing = np.concatenate(([0], np.cumsum(backward_missing)))
+		self.cost = self._forward[-1] + self.cost_matrix[route[-1], route[0]]
+
+	def successor( self, city ):
+		return self.route[(self.position[city] + 1) % len(self.route)]
+
+	def predecessor( self, city ):
+		return self.route[self.position[city] - 1]
+
+	# change in the cost of the edges inside positions i..j when that stretch is walked backwards
+	def reversed_delta( self, i, j ):
+		if self._backward_missing[j] - self._backward_missing[i] > 0:
+			return math.inf
+		return (self._backward[j] - self._backward[i]) - (self._forward[j] - self._forward[i])
+
+	# change in tour cost from reversing positions i..j (0 < i < j < n)
+	# Time O(1)
+	def reversal_delta( self, i, j ):
+		cost = self.cost_matrix
+		route = self.route
+		before = route[i - 1]
+		after = route[(j + 1) % len(route)]
+		return cost[before, route[j]] + cost[route[i], after] - cost[before, route[i]] - cost[route[j], after] \
+			+ self.reversed_delta(i, j)
+
+	# same for positions i..j that may wrap around the end of the route (j < i), leaving
+	# out at least one city
+	def cyclic_reversal_delta( self, i, j ):
+		if i <= j:
+			return self.reversal_delta(i, j)
+		cost = self.cost_matrix
+		route = self.route
+		before = route[i - 1]
+		after = route[j + 1]
+		# the edge from the last city to the first is inside the stretch too
+		wrap = cost[route[0], route[-1]]
+		if wrap == math.inf:
+			return math.inf
+		inner = self.reversed_delta(i, len(route) - 1) + self.reversed_delta(0, j) + wrap - cost[route[-1], route[0]]
+		return cost[before, route[j]] + cost[route[i], after] - cost[before, route[i]] - cost[route[j], after] + inner
+
+	def reverse( self, i, j ):
+		self.route[i:j + 1] = self.route[i:j + 1][::-1].copy()
+		self._update()
+
+	# change in tour cost from moving positions i..j (0 < i <= j < n), in the same direction,
+	# to between positions k and k+1 (k < i-1 or k > j)
+	# ... p [a ... e] s ... c d ... becomes ... p s ... c [a ... e] d ...
+	# Time O(1)
+	def move_delta( self, i, j, k ):
+		cost = self.cost_matrix
+		route = self.route
+		n = len(route)
+		p, a, e, s = route[i - 1], route[i], route[j], route[(j + 1) % n]
+		c, d = route[k], route[(k + 1) % n]
+		return cost[p, s] + cost[c, a] + cost[e, d] - cost[p, a] - cost[e, s] - cost[c, d]
+
+	# rotate the route so that the city comes first; the tour stays the same
+	def rotate_to_front( self, city ):
+		self.route = np.roll(self.route, -self.position[city])
+		self._update()
+
+	def set_route( self, route ):
+		self.route = np.array(route, dtype=int)
+		self._update()
+
+	def move( self, i, j, k ):
+		route = self.route
+		if k > j:
+			self.route = np.concatenate((route[:i], route[j + 1:k + 1], route[i:j + 1], route[k + 1:]))
+		else:
+			self.route = np.concatenate((route[:k + 1], route[i:j + 1], route[k + 1:i], route[j + 1:]))
+		self._update()
+
+
+# 2-opt: for every city a with successor b we try the new edge a->c (and c->a) for each c in
+# a's neighbor list, reversing the stretch of the route between them.
+# Returns the number of improving moves made, stops early once the deadline passes.
+# Every move is recorded in the deadline's anytime trace.
+def two_opt( tour, neighbors, deadline=None ):
+	return search(tour, deadline, [lambda a: best_reversal(tour, neighbors, a)])
+
+
+# Or-opt: move a chain of 1 to max_length cities, starting at city a, without reversing it to
+# between two other cities c d, trying a new edge into the chain from each c in a's incoming
+# neighbor list (see neighbor_lists on the transposed matrix) and a new edge out of the chain
+# to each d in its last city's neighbor list.
+def or_opt( tour, neighbors, incoming, deadline=None, max_length=3 ):
+	return search(tour, deadline, [lambda a: best_chain_move(tour, neighbors, incoming, max_length, a)])
+
+
+# 3-opt segment insertion: the orientation preserving 3-opt move that swaps two neighboring
+# stretches of the route, ... a [b ... e] [f ... c] d ... becomes ... a f ... c b ... e d ...
+# The new edge a->f comes from a's neighbor list and e->d from e's (its first inner_neighbors).
+# No edge is walked backwards, so it is as cheap to score with asymmetric costs as with symmetric ones.
+def segment_insertion( tour, neighbors, deadline=None, inner_neighbors=5 ):
+	return search(tour, deadline, [lambda a: best_segment_insertion(tour, neighbors, inner_neighbors, a)])
+
+
+# all of the above: every city looked at gets the best move of any of them
+def local_search( tour, neighbors, incoming, deadline=None, max_length=3, inner_neighbors=5 ):
+	return search(tour, deadline, [lambda a: best_reversal(tour, neighbors, a),
+									lambda a: best_chain_move(tour, neighbors, incoming, max_length, a),
+									lambda a: best_segment_insertion(tour, neighbors, inner_neighbors, a)])
+
+
+# Each finder takes a city a and returns the best improving (delta, move) around it, or None.
+# Cities are looked at in turn using don't-look bits: a city whose neighborhood has nothing to offer
+# is not looked at again until a move changes one of its edges.  The search starts from the given
+# cities, or all of them.
+def search( tour, deadline, finders, cities=None ):
+	if deadline is None:
+		deadline = Deadline(time.time(), math.inf)
+	n = len(tour.route)
+	if n < 4:
+		return 0
+	moves = 0
+	queue = deque(tour.route.tolist() if cities is None else cities)
+	queued = np.zeros(n, dtype=bool)
+	queued[list(queue)] = True
+	while len(queue) != 0:
+		if deadline.expired():
+			break
+		a = queue.popleft()
+		queued[a] = False
+		best_delta = 0.0
+		best_move = None
+		for finder in finders:
+			found = finder(a)
+			if found is not None and found[0] < best_delta:
+				best_delta, best_move = found
+		if best_move is None:
+			continue
+		# the cities whose edges change get looked at again
+		touched = apply_move(tour, best_move)
+		moves += 1
+		deadline.record(int(tour.cost), tour.route)
+		for city in touched:
+			if not queued[city]:
+				queued[city] = True
+				queue.append(city)
+	return moves
+
+
+# Moves are ('reverse', i, j) (Tour.reverse), ('move', i, j, k) (Tour.move) or
+# ('reversals', city, [j, ...], touched): Tour.reverse(1, j) for each j in turn after rotating
+# the city to the front.  Returns the cities whose edges change.
+def apply_move( tour, move ):
+	route = tour.route
+	n = len(route)
+	if move[0] == 'reverse':
+		kind, i, j = move
+		touched = [route[i - 1], route[i], route[j], route[(j + 1) % n]]
+		tour.reverse(i, j)
+	elif move[0] == 'move':
+		kind, i, j, k = move
+		touched = [route[i - 1], route[i], route[j], route[(j + 1) % n], route[k], route[(k + 1) % n]]
+		tour.move(i, j, k)
+	else:
+		kind, city, reversals, touched = move
+		tour.rotate_to_front(city)
+		for j in reversals:
+			tour.reverse(1, j)
+	return touched
+
+
+# the best improving (delta, move) of each kind for city a, None if there is none
+
+def best_reversal( tour, neighbors, a ):
+	p = tour.position[a]
+	best = None
+	for c in neighbors[a]:
+		if c < 0:
+			break
+		q = tour.position[c]
+		if q > p + 1:
+			# ... a b ... c d ... becomes ... a c ... b d ...
+			i, j = p + 1, q
+		elif q < p - 1:
+			# ... c d ... a b ... becomes ... c a ... d b ...
+			i, j = q + 1, p
+		else:
+			continue
+		# the first city stays in place, so the reversed stretch never wraps around the array
+		delta = tour.reversal_delta(i, j)
+		if delta < 0 and (best is None or delta < best[0]):
+			best = (delta, ('reverse', i, j))
+	return best
+
+def best_chain_move( tour, neighbors, incoming, max_length, a ):
+	n = len(tour.route)
+	i = tour.position[a]
+	best = None
+	# the first city stays in place, so chains start after it
+	if i == 0:
+		return None
+	# between c and d, where c -> a is cheap or the chain's last city -> d is
+	after_incoming = [tour.position[c] for c in incoming[a] if c >= 0]
+	for j in range(i, min(i + max_length, n)):
+		insert_after = after_incoming + [(tour.position[d] - 1) % n for d in neighbors[tour.route[j]] if d >= 0]
+		for k in insert_after:
+			if i - 1 <= k <= j:
+				continue
+			delta = tour.move_delta(i, j, k)
+			if delta < 0 and (best is None or delta < best[0]):
+				best = (delta, ('move', i, j, k))
+	return best
+
+def best_segment_insertion( tour, neighbors, inner_neighbors, a ):
+	n = len(tour.route)
+	p = tour.position[a]
+	best = None
+	for f in neighbors[a]:
+		if f < 0:
+			break
+		# a [b ... e] f: the first stretch runs from after a to before f
+		q = tour.position[f]
+		if q <= p + 1:
+			continue
+		i, j = p + 1, q - 1
+		for d in neighbors[tour.route[j]][:inner_neighbors]:
+			if d < 0:
+				break
+			# [f ... c] d: the second stretch runs from f to before d, which may be the first city
+			k = (tour.position[d] - 1) % n
+			if k <= j:
+				continue
+			delta = tour.move_delta(i, j, k)
+			if delta < 0 and (best is None or delta < best[0]):
+				best = (delta, ('move', i, j, k))
+	return best
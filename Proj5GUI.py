@@ -4,7 +4,9 @@ import math
 import random
 import signal
 import sys
+import threading
 import time
+import numpy as np
 
 
 from which_pyqt import PYQT_VER
@@ -30,6 +32,14 @@ from TSPClasses import *
 
 
 class PointLineView( QWidget ):
+
+	# arrowheads and labels of a color are only drawn while it has at most this many; past that
+	# they are too small and crowded to read anyway, and cost most of the drawing time
+	MAX_ARROWS = 500
+	MAX_LABELS = 500
+	ARROW_SIZE = 5.0
+	CITY_SIZE = 2.0 # DIAMETER
+
 	def __init__( self, status_bar, data_range ):
 		super(QWidget,self).__init__()
 		self.setMinimumSize(950,300)
@@ -41,28 +51,35 @@ class PointLineView( QWidget ):
 		self.data_range = data_range
 		self.start_pt = None
 		self.end_pt = None
+		# what paintEvent built from the lists above for the current widget size:
+		# the lines and arrowheads of every edge color, and the cities drawn into a pixmap
+		self._edgeCache = {}
+		self._pointLayer = None
 
 	def displayStatusText(self, text):
 		self.status_bar.showMessage(text)
 
 	def clearPoints(self):
 		self.pointList = {}
+		self._pointLayer = None
 
 	def clearEdges(self,removeColors = None):
 		self.edgeList = {}
+		self._edgeCache = {}
 		if removeColors:							# allows removal of edge labels without removing node labels, for example
 			for color in removeColors:
 				if color in self.labelList:
 					del self.labelList[color]			
 		else:
 			self.labelList = {}
-		self.repaint()
+		self.update()
 
 	def addPoints( self, point_list, color ):
 		if color in self.pointList:
 			self.pointList[color].extend( point_list )
 		else:
 			self.pointList[color] = point_list
+		self._pointLayer = None
 
 #	def setStartLoc( self, point ):
 #		self.start_pt = point
@@ -81,14 +98,16 @@ class PointLineView( QWidget ):
 		assert( type(endPt)	  == QPointF )
 		assert( type(label)	  == str )
 
-		edge = QLineF(startPt, endPt)
+		# kept as plain numbers, paintEvent turns all the edges of a color into arrays at once
+		edge = (startPt.x(), startPt.y(), endPt.x(), endPt.y())
 		if edgeColor in self.edgeList.keys():
 			self.edgeList[edgeColor].append( edge )
 		else:
 			self.edgeList[edgeColor] = [edge]
+		self._edgeCache.pop( edgeColor, None )
 
-		midp = QPointF( (edge.x1()*0.2 + edge.x2()*0.8), 
-						(edge.y1()*0.2 + edge.y2()*0.8) )
+		midp = QPointF( (edge[0]*0.2 + edge[2]*0.8), 
+						(edge[1]*0.2 + edge[3]*0.8) )
 		self.addLabel( midp, label, labelColor, xoffset=xoffset )
 
 	def addLabel( self, point, label, labelColor,xoffset=0.0 ):
@@ -98,12 +117,8 @@ class PointLineView( QWidget ):
 			self.labelList[labelColor] = [(point,label,xoffset)]
 
 
-
-
-	def paintEvent(self, event):
-		painter = QPainter(self)
-		painter.setRenderHint(QPainter.Antialiasing,True)
-
+	# data coordinates to widget coordinates: the data range fills the widget, centered, with y up
+	def screenTransform(self):
 		xr = self.data_range['x']
 		yr = self.data_range['y']
 		w = self.width()
@@ -113,87 +128,108 @@ class PointLineView( QWidget ):
 			 scale = w / (xr[1]-xr[0])
 		else:
 			 scale = h / (yr[1]-yr[0])
-
-		tform = QTransform()
-		tform.translate(self.width()/2.0,self.height()/2.0)
-		tform.scale(1.0,-1.0)
-		painter.setTransform(tform)
-
-		for color in self.edgeList:
+		return scale, w/2.0, h/2.0
+
+	# the lines (one list for drawLines) and arrowheads (one path) of the edges of a color
+	def edgeShapes(self, edges):
+		scale, cx, cy = self.screenTransform()
+		ends = np.array( edges, dtype=float ).reshape( -1, 4 )
+		ends[:,0::2] = cx + scale*ends[:,0::2]
+		ends[:,1::2] = cy - scale*ends[:,1::2]
+		lines = [QLineF(*line) for line in ends.tolist()]
+
+		arrows = None
+		if len(edges) <= self.MAX_ARROWS:
+			# a triangle at the end of every edge (that has a length), pointing along it
+			direction = ends[:,2:] - ends[:,:2]
+			length = np.hypot( direction[:,0], direction[:,1] )
+			ends, direction = ends[length > 0], direction[length > 0] / length[length > 0,None]
+			perp = np.stack( (-direction[:,1], direction[:,0]), axis=1 )
+			tip = ends[:,2:]
+			left = tip - self.ARROW_SIZE*(2*direction + perp)
+			right = tip - self.ARROW_SIZE*(2*direction - perp)
+			arrows = QPainterPath()
+			arrows.setFillRule( Qt.WindingFill )
+			for x0, y0, x1, y1, x2, y2 in np.hstack( (tip, left, right) ).tolist():
+				arrows.addPolygon( QPolygonF( [QPointF(x0,y0), QPointF(x1,y1), QPointF(x2,y2)] ) )
+				arrows.closeSubpath()
+		return lines, arrows
+
+	# every city drawn on a transparent pixmap the size of the widget
+	def pointLayer(self):
+		scale, cx, cy = self.screenTransform()
+		layer = QPixmap( self.size() )
+		layer.fill( Qt.transparent )
+		painter = QPainter( layer )
+		painter.setRenderHint(QPainter.Antialiasing,True)
+		for color in self.pointList:
 			c = QColor(color[0],color[1],color[2])
 			painter.setPen( c )
-			for edge in self.edgeList[color]:
-				ln = QLineF( scale*edge.x1(), scale*edge.y1(), scale*edge.x2(), scale*edge.y2() )
-				painter.drawLine( ln )
+			painter.setBrush( c )
+			for point in self.pointList[color]:
+				pt = QPointF(cx + scale*point.x(), cy - scale*point.y())
+				painter.drawEllipse( pt, self.CITY_SIZE, self.CITY_SIZE)
+		painter.end()
+		return layer
+
+
+	def paintEvent(self, event):
+		painter = QPainter(self)
+		painter.setRenderHint(QPainter.Antialiasing,True)
+		scale, cx, cy = self.screenTransform()
+		size = (self.width(), self.height())
 
 		for color in self.edgeList:
+			if color not in self._edgeCache or self._edgeCache[color][0] != size:
+				self._edgeCache[color] = (size,) + self.edgeShapes( self.edgeList[color] )
+			size_drawn, lines, arrows = self._edgeCache[color]
 			c = QColor(color[0],color[1],color[2])
 			painter.setPen( c )
-			for edge in self.edgeList[color]:
-				#arrow_scale = .015
-				arrow_scale = 5.0
-				unit_edge = ( edge.x2() - edge.x1(), edge.y2() - edge.y1() )
-				unit_edge_mag = math.sqrt( ( edge.x2() - edge.x1())**2 + ( edge.y2() - edge.y1() )**2 )
-				unit_edge = (unit_edge[0] / unit_edge_mag, unit_edge[1] / unit_edge_mag )
-				unit_edge_perp = (-unit_edge[1], unit_edge[0])
-
-				temp_tform = QTransform()
-				temp_tform.translate(self.width()/2.0,self.height()/2.0)
-				temp_tform.scale(1.0,-1.0)
-				temp_tform.translate(scale*edge.x2(),scale*edge.y2())
-				temp_tform.scale(1.0,-1.0)
-				painter.setTransform(temp_tform)
-				#painter.drawText( RECT, label[1], align )
-
-				tri_pts = []
-				tri_pts.append( QPointF(0,0) )
-				tri_pts.append( QPointF(-arrow_scale*(2*unit_edge[0] + unit_edge_perp[0]),
-										arrow_scale*(2*unit_edge[1] + unit_edge_perp[1])) )
-				tri_pts.append( QPointF(-arrow_scale*(2*unit_edge[0] - unit_edge_perp[0]),
-										arrow_scale*(2*unit_edge[1] - unit_edge_perp[1])) )
-				tri = QPolygonF( tri_pts )
-				b = painter.brush()
+			painter.drawLines( lines )
+			if arrows is not None:
 				painter.setBrush( c )
-				painter.drawPolygon( tri )
-				painter.setBrush( b )
-
-		painter.setTransform(tform)
-		font = QFont("Monospace")
-		font.setStyleHint(QFont.TypeWriter)
+				painter.drawPath( arrows )
+				painter.setBrush( Qt.NoBrush )
 
 		R = 1.0E3
-		CITY_SIZE = 2.0 # DIAMETER
-		RECT = QRectF(-R,-R,2.0*R,2.0*R)
 		align = QTextOption( Qt.Alignment(Qt.AlignHCenter | Qt.AlignVCenter) )
 		for color in self.labelList:
+			if len(self.labelList[color]) > self.MAX_LABELS:
+				continue
 			c = QColor(color[0],color[1],color[2])
 			painter.setPen( c )
-			for label in self.labelList[color]:
-				temp_tform = QTransform()
-				temp_tform.translate(self.width()/2.0,self.height()/2.0)
-				temp_tform.scale(1.0,-1.0)
-				pt = label[0]
-				xoff = label[2]
-				temp_tform.translate(scale*pt.x()+xoff,scale*pt.y())
-				temp_tform.scale(1.0,-1.0)
-				painter.setTransform(temp_tform)
-				painter.drawText( RECT, label[1], align )
-
-		painter.setTransform(tform)
-		for color in self.pointList:
-			c = QColor(color[0],color[1],color[2])
-			painter.setPen( c )
-			b = painter.brush()
-			painter.setBrush(c)
-			for point in self.pointList[color]:
-				pt = QPointF(scale*point.x(), scale*point.y())
-				painter.drawEllipse( pt, CITY_SIZE, CITY_SIZE)
-			painter.setBrush(b)
+			for pt, label, xoff in self.labelList[color]:
+				x = cx + scale*pt.x() + xoff
+				y = cy - scale*pt.y()
+				painter.drawText( QRectF(x-R,y-R,2.0*R,2.0*R), label, align )
+
+		if self._pointLayer is None or self._pointLayer.size() != self.size():
+			self._pointLayer = self.pointLayer()
+		painter.drawPixmap( 0, 0, self._pointLayer )
+
+
+
+# runs a solver entry point off the GUI thread, keeping its results for when the thread finishes
+class SolverThread( QThread ):
+	def __init__( self, solve_func, time_allowance ):
+		super(SolverThread,self).__init__()
+		self.solve_func = solve_func
+		self.time_allowance = time_allowance
+		self.results = None
+
+	def run( self ):
+		self.results = self.solve_func( time_allowance=self.time_allowance )
 
 
 
 class Proj5GUI( QMainWindow ):
 
+	# redraw new BSSFs found while solving at most this often
+	REDRAW_INTERVAL_MS = 100
+	# generate scenarios exactly as they used to be generated, one random number at a time
+	# (see TSPClasses.randomPoints); otherwise only the city locations are the same
+	COMPATIBLE_SCENARIOS = False
+
 	def __init__( self ):
 		super(Proj5GUI,self).__init__()
 
@@ -202,6 +238,10 @@ class Proj5GUI( QMainWindow ):
 		self._MAX_SEED = 1000 
 
 		self._scenario = None
+		self.solverThread = None
+		# newest BSSF handed over by the solving thread as (cost, route), drawn by the redraw timer
+		self._newBSSF = None
+		self._newBSSFLock = threading.Lock()
 		self.initUI()
 		self.solver = TSPSolver( self.view )
 		self.genParams = {'size':None,'seed':None,'diff':None}
@@ -211,27 +251,16 @@ class Proj5GUI( QMainWindow ):
 	def newPoints(self):		
 		# TODO - ERROR CHECKING!!!!
 		seed = int(self.curSeed.text())
-		random.seed( seed )
-
-		ptlist = []
-		RANGE = self.data_range
-		xr = self.data_range['x']
-		yr = self.data_range['y']
 		npoints = int(self.size.text())
-		while len(ptlist) < npoints:
-			x = random.uniform(0.0,1.0)
-			y = random.uniform(0.0,1.0)
-			if True:
-				xval = xr[0] + (xr[1]-xr[0])*x
-				yval = yr[0] + (yr[1]-yr[0])*y
-				ptlist.append( QPointF(xval,yval) )
-		return ptlist
+		points = randomPoints( npoints, seed, self.data_range, self.COMPATIBLE_SCENARIOS )
+		return [QPointF(x,y) for x, y in points.tolist()]
 
 	def generateNetwork(self):
 		points = self.newPoints() # uses current rand seed
 		diff = self.diffDropDown.currentText()
 		rand_seed = int(self.curSeed.text())
-		self._scenario = Scenario( city_locations=points, difficulty=diff, rand_seed=rand_seed )
+		self._scenario = Scenario( city_locations=points, difficulty=diff, rand_seed=rand_seed,
+								   compatible=self.COMPATIBLE_SCENARIOS )
 
 		self.genParams = {'size':self.size.text(),'seed':self.curSeed.text(),'diff':diff}
 		self.view.clearEdges()
@@ -242,15 +271,15 @@ class Proj5GUI( QMainWindow ):
 
 
 	def addCities( self ):
-		cities = self._scenario.getCities()
+		coordinates = self._scenario.getCoordinates()
 		self.view.clearEdges()
-		for city in cities:
-		   self.view.addLabel( QPointF(city._x, city._y), city._name, \
+		for (x, y), name in zip( coordinates.tolist(), cityNames( len(coordinates) ) ):
+		   self.view.addLabel( QPointF(x, y), name, \
 							   labelColor=(128,128,128), xoffset=10.0 )
 
 	def generateClicked(self):
 		self.generateNetwork()
-		self.view.addPoints( [QPointF(c._x,c._y) for c in self._scenario.getCities()], (0,0,0) )
+		self.view.addPoints( [QPointF(x,y) for x, y in self._scenario.getCoordinates().tolist()], (0,0,0) )
 		self.solveButton.setEnabled(True)
 		self.graphReady = True
 		self.checkGenInputs()
@@ -261,37 +290,38 @@ class Proj5GUI( QMainWindow ):
 		self.totalStates.setText( '--' )
 		self.prunedStates.setText( '--' )
 		self.statusBar.showMessage('')
-		self.view.repaint()
+		self.view.update()
 
 
-	def displaySolution( self ) :						# what about calling this somehow every time a new bssf is found?
+	def displaySolution( self ) :						# also called by showNewBSSF every time a new bssf is found
 		self.view.clearEdges([(64,64,255)])				# get rid of edge labels but not point labels
 		if self._solution:
 			self.addCities()
-			edges = self._solution.enumerateEdges()
-			if edges:
+			edges = self._solution.edgeArrays()
+			if edges is not None:
 				edgeColor  = (128,128,255)
 				labelColor = (64,64,255)
-				for edge in edges:
-					pt1,pt2,label = edge
-					self.view.addEdge( QPointF(pt1._x,pt1._y), \
-									   QPointF(pt2._x,pt2._y), \
+				coordinates = self._scenario.getCoordinates()
+				sources, destinations, costs = edges
+				for (x1,y1), (x2,y2), label in zip( coordinates[sources].tolist(), coordinates[destinations].tolist(), costs.tolist() ):
+					self.view.addEdge( QPointF(x1,y1), \
+									   QPointF(x2,y2), \
 									   '{}'.format(label), edgeColor, labelColor )
 		else:
 			self.statusBar.showMessage('No Solution Found.')
-		self.view.repaint()
+		self.view.update()
 
 
 	def randSeedClicked(self):
 		new_seed = random.randint(0, self._MAX_SEED-1)
 		self.curSeed.setText( '{}'.format(new_seed) )
-		self.view.repaint()
+		self.view.update()
 
 	def solveClicked(self):								# need to reset display??? and say "processing..." at bottom???
 		self.solver.setupWithScenario(self._scenario)
+		self.solver.setBSSFCallback(self.bssfFound)
 
 		max_time = float( self.timeLimit.text() )
-		# TODO - start on a separate thread
 		self.view.clearEdges([(64,64,255)])				# get rid of edge labels but not point labels
 		self.numSolutions.setText( '--' )
 		self.tourCost.setText( '--' )
@@ -300,10 +330,45 @@ class Proj5GUI( QMainWindow ):
 		self.totalStates.setText( '--' )
 		self.prunedStates.setText( '--' )
 		self.statusBar.showMessage('Processing...')
-		#self.view.repaint()
-		#app.processEvents()
-		solve_func = 'self.solver.'+self.ALGORITHMS[self.algDropDown.currentIndex()][1]
-		results = eval(solve_func)(time_allowance=max_time )
+		self.generateButton.setEnabled(False)
+		self.solveButton.setEnabled(False)
+		self.cancelButton.setEnabled(True)
+
+		# solve on a separate thread, so the window keeps drawing and can cancel
+		solve_func = getattr(self.solver, self.ALGORITHMS[self.algDropDown.currentIndex()][1])
+		self.solverThread = SolverThread( solve_func, max_time )
+		self.solverThread.finished.connect(self.solveFinished)
+		self.solverThread.start()
+		self.redrawTimer.start()
+
+	# called on the solving thread, so only hand the solution over to the redraw timer
+	def bssfFound(self, cost, route):
+		with self._newBSSFLock:
+			self._newBSSF = (cost, list(route))
+
+	def showNewBSSF(self):
+		with self._newBSSFLock:
+			newBSSF = self._newBSSF
+			self._newBSSF = None
+		if newBSSF:
+			cost, route = newBSSF
+			self._solution = TSPSolution( route, self._scenario )
+			self.tourCost.setText( '{}'.format(cost) )
+			self.displaySolution()
+
+	def cancelClicked(self):
+		self.solver.cancel()
+		self.cancelButton.setEnabled(False)
+		self.statusBar.showMessage('Cancelling...')
+
+	def solveFinished(self):
+		self.redrawTimer.stop()
+		with self._newBSSFLock:
+			self._newBSSF = None
+		results = self.solverThread.results
+		self.solverThread = None
+		self.cancelButton.setEnabled(False)
+		self.checkGenInputs()
 		if results:
 			self.statusBar.showMessage('')
 			self.numSolutions.setText( '{}'.format(results['count']) )
@@ -320,10 +385,19 @@ class Proj5GUI( QMainWindow ):
 			self.displaySolution()
 		else:
 			print( 'GOT NULL SOLUTION BACK!!' )		#probably shouldn't ever use this...
-		self.view.repaint()
-#		app.processEvents()
+		self.view.update()
+
+	# don't leave the solving thread running when the window goes away
+	def closeEvent(self, event):
+		if self.solverThread:
+			self.solver.cancel()
+			self.solverThread.wait()
+		super(Proj5GUI,self).closeEvent(event)
 
 	def checkGenInputs(self):
+		# the buttons stay off until the solver is done
+		if self.solverThread:
+			return
 		seed  = self.curSeed.text()
 		size = self.size.text()
 		diff = self.diffDropDown.currentText()
@@ -370,7 +444,13 @@ class Proj5GUI( QMainWindow ):
 		('Default                            ','defaultRandomTour'), \
 		('Greedy','greedy'), \
 		('Branch and Bound','branchAndBound'), \
-		('Fancy','fancy') \
+		('Fancy','fancy'), \
+		('Parallel Branch and Bound','parallelBranchAndBound'), \
+		('Held-Karp','heldKarp'), \
+		('Lin-Kernighan','linKernighan'), \
+		('Simulated Annealing','simulatedAnnealing'), \
+		('Genetic','genetic'), \
+		('Ant Colony','antColony') \
 	]															# whitespace hack to get longest to display correctly
 
 	def initUI( self ):
@@ -394,6 +474,9 @@ class Proj5GUI( QMainWindow ):
 		self.randSeedButton = QPushButton('Randomize Seed')
 		self.generateButton = QPushButton('Generate Scenario')
 		self.solveButton	= QPushButton('Solve TSP')
+		self.cancelButton	= QPushButton('Cancel')
+		self.redrawTimer	= QTimer(self)
+		self.redrawTimer.setInterval(self.REDRAW_INTERVAL_MS)
 
 		self.curSeed		= QLineEdit('20')
 		self.curSeed.setFixedWidth(100)
@@ -462,6 +545,7 @@ class Proj5GUI( QMainWindow ):
 		h.addWidget( self.timeLimit )
 		h.addWidget( QLabel( 'seconds' ) )
 		h.addWidget( self.solveButton )
+		h.addWidget( self.cancelButton )
 		h.addStretch(1)
 		vbox.addLayout(h)
 
@@ -481,6 +565,7 @@ class Proj5GUI( QMainWindow ):
 
 		self.lastPath = (None,None)
 		self.solveButton.setEnabled(False)
+		self.cancelButton.setEnabled(False)
 
 		self.curSeed.textChanged.connect(self.checkGenInputs)
 		self.size.textChanged.connect(self.checkGenInputs)
@@ -488,6 +573,8 @@ class Proj5GUI( QMainWindow ):
 		self.randSeedButton.clicked.connect(self.randSeedClicked)
 		self.generateButton.clicked.connect(self.generateClicked)
 		self.solveButton.clicked.connect(self.solveClicked)
+		self.cancelButton.clicked.connect(self.cancelClicked)
+		self.redrawTimer.timeout.connect(self.showNewBSSF)
 
 		self.diffDropDown.addItem('Easy                               ')					# Weird hack to make box wide enough to show all of last item
 		self.diffDropDown.addItem('Normal')
@@ -0,0 +1,124 @@
+import math
+import time
+import numpy as np
+
+
+''' <summary>
+	Simulated annealing on a LocalSearch.Tour.  Moves are drawn at random around
+	the cities' candidate neighbors, reversals (2-opt) and chain moves (Or-opt) half
+	and half, and scored a block at a time: one set of array operations on the
+	tour's prefix sums gives the deltas of the whole block, against one temperature.
+	The first move of the block that passes the Metropolis test is made and the
+	rest are thrown away, which is the same as trying them one after another, since
+	a rejected move leaves the tour as it was.  At low temperatures nearly every
+	move is rejected, so the per move Python overhead is gone where most of the
+	moves are tried.
+	</summary> '''
+
+
+# moves scored together
+BLOCK_SIZE = 256
+# the default temperatures, as fractions of the average edge cost of the starting tour
+START_TEMPERATURE = 0.1
+END_TEMPERATURE = 0.001
+
+# temperature at progress 0..1 from the start to the end temperature
+COOLING_SCHEDULES = {
+	'geometric': lambda start, end, progress: start * (end / start) ** progress,
+	'linear': lambda start, end, progress: start + (end - start) * progress,
+}
+
+
+# count random moves as arrays (kinds, i, j, k, deltas): kind 0 reverses positions i..j (Tour.reverse),
+# kind 1 moves positions i..j, a chain of 1 to max_length cities, to after position k (Tour.move).
+# Moves that cannot be made have a delta of np.inf.
+def random_moves( tour, neighbors, incoming, count, max_length=3 ):
+	route = tour.route
+	position = tour.position
+	cost = tour.cost_matrix
+	n = len(route)
+	kinds = np.random.randint(2, size=count)
+	p = position[np.random.randint(n, size=count)]
+	# a reversal adds an edge to a city c from the first city's neighbors, a chain move one from c
+	columns = np.random.randint(neighbors.shape[1], size=count)
+	c = np.where(kinds == 0, neighbors[route[p], columns], incoming[route[p], columns])
+	q = position[c]
+
+	# ... a b ... c d ... becomes ... a c ... b d ..., or ... c d ... a b ... becomes ... c a ... d b ...
+	reverse_i = np.where(q > p, p + 1, q + 1)
+	reverse_j = np.where(q > p, q, p)
+	# ... c d ... p [a ... e] s ... becomes ... c [a ... e] d ... p s ...
+	move_i = p
+	move_j = np.minimum(p + np.random.randint(max_length, size=count), n - 1)
+	move_k = q
+	i = np.where(kinds == 0, reverse_i, move_i)
+	j = np.where(kinds == 0, reverse_j, move_j)
+	k = np.where(kinds == 0, 0, move_k)
+	valid = (c >= 0) & np.where(kinds == 0, np.abs(q - p) > 1, (p > 0) & ((k < i - 1) | (k > j)))
+	i = np.where(valid, i, 1)
+	j = np.where(valid, j, 1)
+
+	before, first, last, after = route[i - 1], route[i], route[j], route[(j + 1) % n]
+	with np.errstate(invalid='ignore'):
+		# see Tour.reversal_delta and Tour.move_delta
+		reversed_inner = np.where(tour._backward_missing[j] - tour._backward_missing[i] > 0, math.inf,
+								  (tour._backward[j] - tour._backward[i]) - (tour._forward[j] - tour._forward[i]))
+		reverse_deltas = cost[before, last] + cost[first, after] - cost[before, first] - cost[last, after] + reversed_inner
+		at, behind = route[k], route[(k + 1) % n]
+		move_deltas = cost[before, after] + cost[at, first] + cost[last, behind] \
+			- cost[before, first] - cost[last, after] - cost[at, behind]
+		deltas = np.where(kinds == 0, reverse_deltas, move_deltas)
+	deltas[~valid | np.isnan(deltas)] = math.inf
+	return kinds, i, j, k, deltas
+
+
+# Anneal from start_temperature to end_temperature (by default see START_TEMPERATURE and
+# END_TEMPERATURE) over the time left before the deadline, or over max_moves moves tried.
+# tour ends up as the best tour found.  Returns (improvements of the best tour, moves tried,
+# moves made).
+def anneal( tour, neighbors, incoming, deadline, start_temperature=None, end_temperature=None,
+			cooling='geometric', block_size=BLOCK_SIZE, max_moves=None ):
+	if cooling not in COOLING_SCHEDULES:
+		raise ValueError('Unsupported cooling schedule: {}'.format(cooling))
+	schedule = COOLING_SCHEDULES[cooling]
+	improvements = 0
+	tried = 0
+	made = 0
+	if len(tour.route) < 5 or neighbors.shape[1] == 0:
+		return improvements, tried, made
+	# the temperature only matters relative to the deltas, which scale with the edge costs
+	average_edge = tour.cost / len(tour.route)
+	if start_temperature is None:
+		start_temperature = START_TEMPERATURE * average_edge
+	if end_temperature is None:
+		end_temperature = END_TEMPERATURE * average_edge
+	best_route = tour.route.copy()
+	best_cost = tour.cost
+	start_time = time.time()
+	while not deadline.expired() and (max_moves is None or tried < max_moves):
+		if max_moves is None:
+			progress = (time.time() - start_time) / max(deadline.end_time - start_time, 1e-9)
+		else:
+			progress = tried / max_moves
+		temperature = schedule(start_temperature, end_temperature, min(progress, 1.0))
+
+		kinds, i, j, k, deltas = random_moves(tour, neighbors, incoming, block_size)
+		with np.errstate(over='ignore'):
+			accepted = (deltas < 0) | (np.random.random_sample(block_size) < np.exp(-deltas / temperature))
+		if not accepted.any():
+			tried += block_size
+			continue
+		m = int(np.argmax(accepted))
+		tried += m + 1
+		made += 1
+		if kinds[m] == 0:
+			tour.reverse(i[m], j[m])
+		else:
+			tour.move(i[m], j[m], k[m])
+		if tour.cost < best_cost:
+			best_route = tour.route.copy()
+			best_cost = tour.cost
+			improvements += 1
+			deadline.record(int(best_cost), best_route)
+	tour.set_route(best_route)
+	return improvements, tried, made
@@ -1,24 +1,28 @@
 import math
-import copy
+import numpy as np
 
 class State:
 
-    # Space O(n^2), Time O(n) + O(n^2)
-    def __init__(self, parent_state, to_index, cities):
+    # a state only keeps its own reduced cost matrix, the route is followed back through the parent states
+    __slots__ = ('matrix', 'row_zeros', 'column_zeros', 'parent', 'parent_state_lower_bound',
+                 'lower_bound', 'bound', 'depth', 'start_index', 'to_index', 'visited')
+
+    # Space O(n^2), Time O(n^2) to copy the matrix + O(n) for each row or column we have to reduce again
+    def __init__(self, parent_state=None, to_index=None):
+        self.parent = parent_state
         if parent_state != None:
-            self.matrix = copy.deepcopy(parent_state.matrix)
+            self.matrix = parent_state.matrix.copy()
+            self.row_zeros = parent_state.row_zeros.copy()
+            self.column_zeros = parent_state.column_zeros.copy()
             self.parent_state_lower_bound = parent_state.lower_bound
             self.depth = parent_state.depth + 1
 
-            self.route_set_indices = copy.deepcopy(parent_state.route_set_indices)
-            self.route = copy.deepcopy(parent_state.route)
-
-            self.visited_rows = copy.deepcopy(parent_state.visited_rows)
-            self.visited_columns = copy.deepcopy(parent_state.visited_columns)
+            self.start_index = parent_state.start_index
+            self.visited = parent_state.visited.copy()
 
             # to_index represents the index of the city we are visiting
             self.to_index = to_index
-            self.visit_next_city_and_reduce(parent_state.to_index, to_index, cities)
+            self.visit_next_city_and_reduce(parent_state.to_index, to_index)
 
     # when a state with same lower bound and depth as another state on the queue, heapq.heappush
     # will compare the state objects using this function
@@ -26,113 +30,138 @@ class State:
     def __lt__(self, other):
         return True
 
-    def set_state_zero_matrix(self, matrix, cities, randStartCityIndex):
-        self.matrix = copy.deepcopy(matrix)
+    def set_state_zero_matrix(self, matrix, randStartCityIndex):
+        # costs are stored as floats so that math.inf can mark an unusable edge
+        self.matrix = np.array(matrix, dtype=float)
         self.parent_state_lower_bound = 0
         self.depth = 1
 
         # keep track of the cities that we have visited
-        self.route_set_indices = set()
-        self.route = []
-
-        # when we travel between two cities, we will infinite-out the column and row
-        # we will keep track of which columns and rows are infinited-out with these sets
-        self.visited_columns = set()
-        self.visited_rows = set()
+        # the rows we have left and the columns we have entered are infinited-out,
+        # so together with the start city this mask tells us which rows and columns are still in play
+        self.visited = np.zeros(len(self.matrix), dtype=bool)
 
         # select arbitrary start city
 
         # save the start city as the to_index
         # ( this will become the from index when we start visiting cities )
+        self.start_index = randStartCityIndex
         self.to_index = randStartCityIndex
-        # add the index to the set of visited city indices so that we don't have our route
-        self.route_set_indices.add(randStartCityIndex)
-        self.route.append(cities[randStartCityIndex])
+        # mark the index as visited so that we don't have it in our route twice
+        self.visited[randStartCityIndex] = True
 
         self.reduce_state_zero_matrix()
 
-    def visit_next_city_and_reduce(self, from_city_index, to_city_index, cities):
+        # after the reduction every row and column in play has at least one zero
+        # keep count of them so a child state knows which lines lost their last zero
+        self.count_zeros()
+
+    def visit_next_city_and_reduce(self, from_city_index, to_city_index):
         # lower bound = parent state lower bound + cost of path + cost of reduction
         # get cost of path at row = from_city_index , column = to_city_index
-        cost_of_path = self.matrix[from_city_index][to_city_index]
+        cost_of_path = self.matrix[from_city_index, to_city_index]
 
-        # infinite out row from_city_index
-        for i in range(len(self.matrix)):
-            self.matrix[from_city_index][i] = math.inf
-        # add row to visited_rows
-        self.visited_rows.add(from_city_index)
+        # the zeros we are about to infinite out no longer count for their columns / rows
+        self.column_zeros -= self.matrix[from_city_index, :] == 0
+        self.row_zeros -= self.matrix[:, to_city_index] == 0
+        if self.matrix[to_city_index, from_city_index] == 0:
+            self.row_zeros[to_city_index] -= 1
+            self.column_zeros[from_city_index] -= 1
 
+        # infinite out row from_city_index
+        self.matrix[from_city_index, :] = math.inf
         # infinite out column to_city_index
-        for i in range(len(self.matrix)):
-            self.matrix[i][to_city_index] = math.inf
-        # add column to visited_columns
-        self.visited_columns.add(to_city_index)
-
+        self.matrix[:, to_city_index] = math.inf
         # infinite out backwards path
-        self.matrix[to_city_index][from_city_index] = math.inf
-
-        # reduce the matrix and keep track of the cost of reduction
-        cost_of_reduction = 0
-
-        # reduce rows not in visited_rows and add cost
-        for i in range(len(self.matrix)):
-            if i not in self.visited_rows:
-                cost_of_reduction += self.reduce_row(i)
-                # if cost of reduction is infinity, then no need to continue reduction (speed optimization)
-                if cost_of_reduction == math.inf:
-                    break
-        # reduce columns not in visited_columns and add cost
-        for i in range(len(self.matrix)):
-            if i not in self.visited_columns:
-                cost_of_reduction += self.reduce_col(i)
-                # if cost of reduction is infinity, then no need to continue reduction (speed optimization)
-                if cost_of_reduction == math.inf:
-                    break
-        # lower bound = parent state lower bound + cost of path + cost of reduction
-        self.lower_bound = self.parent_state_lower_bound + cost_of_path + cost_of_reduction
+        self.matrix[to_city_index, from_city_index] = math.inf
+
+        # add the index to the visited cities
+        self.visited[to_city_index] = True
 
-        # update route and route_set
-        # add the index to the set of visited city
-        self.route_set_indices.add(to_city_index)
-        self.route.append(cities[to_city_index])
+        # the parent matrix was already reduced, so only the rows and columns that lost their
+        # last zero need to be reduced again; keep track of the cost of reduction
+        cost_of_reduction = self.reduce_changed_lines()
+
+        # lower bound = parent state lower bound + cost of path + cost of reduction
+        self.lower_bound = self.parent_state_lower_bound + float(cost_of_path) + cost_of_reduction
+        # the bound used for pruning, a bound strategy (see Bounds.py) may tighten it further
+        self.bound = self.lower_bound
 
     def get_key(self):
-        return (self.lower_bound * 2) / self.depth
+        return (self.bound * 2) / self.depth
+
+    # Time O(depth)
+    def get_route_indices(self):
+        route = []
+        state = self
+        while state != None:
+            route.append(state.to_index)
+            state = state.parent
+        route.reverse()
+        return route
 
     def reduce_state_zero_matrix(self):
         # lower bound = previous lower bound + cost of path + cost of reduction
-        self.lower_bound = self.parent_state_lower_bound
-        # reduce each row and add the cost of reduction to the lower bound
-        for i in range(len(self.matrix)):
-            self.lower_bound += self.reduce_row(i)
-        # reduce each column and add the cost of reduction to the lower bound
-        for i in range(len(self.matrix)):
-            self.lower_bound += self.reduce_col(i)
-
-    # return the amount to add to the lower bound ( cost of reduction )
-    def reduce_row(self, rowIndex):
-        minimum = math.inf
-        for i in range(len(self.matrix)):
-            if self.matrix[rowIndex][i] < minimum:
-                minimum = self.matrix[rowIndex][i]
-        # we will not modify the matrix if minimum is 0 or infinity
-        if minimum == 0 or minimum == math.inf:
-            return minimum
-        else:
-            for i in range(len(self.matrix)):
-                self.matrix[rowIndex][i] = self.matrix[rowIndex][i] - minimum
-            return minimum
-
+        self.lower_bound = self.parent_state_lower_bound + self.reduce_matrix()
+        self.bound = self.lower_bound
+
+    # rows we have not left yet: every unvisited city plus the city we are currently in
+    def unvisited_rows(self):
+        rows = ~self.visited
+        rows[self.to_index] = True
+        return rows
+
+    # columns we have not entered yet: every unvisited city plus the start city we return to
+    def unvisited_columns(self):
+        columns = ~self.visited
+        columns[self.start_index] = True
+        return columns
+
+    # reduce every row and then every column still in play
     # return the amount to add to the lower bound ( cost of reduction )
-    def reduce_col(self, columnIndex):
-        minimum = math.inf
-        for i in range(len(self.matrix)):
-            if self.matrix[i][columnIndex] < minimum:
-                minimum = self.matrix[i][columnIndex]
-        # we will not modify the matrix if minimum is 0 or infinity
-        if minimum == 0 or minimum == math.inf:
-            return minimum
-        else:
-            for i in range(len(self.matrix)):
-                self.matrix[i][columnIndex] = self.matrix[i][columnIndex] - minimum
-            return minimum
\ No newline at end of file
+    def reduce_matrix(self):
+        row_minimums = np.where(self.unvisited_rows(), self.matrix.min(axis=1), 0.0)
+        # a row with nowhere left to go means there is no tour from here (no need to continue reduction)
+        if np.isinf(row_minimums).any():
+            return math.inf
+        self.matrix -= row_minimums[:, np.newaxis]
+
+        column_minimums = np.where(self.unvisited_columns(), self.matrix.min(axis=0), 0.0)
+        if np.isinf(column_minimums).any():
+            return math.inf
+        self.matrix -= column_minimums[np.newaxis, :]
+
+        return float(row_minimums.sum() + column_minimums.sum())
+
+    def count_zeros(self):
+        zeros = self.matrix == 0
+        self.row_zeros = zeros.sum(axis=1)
+        self.column_zeros = zeros.sum(axis=0)
+
+    # same cost of reduction as reduce_matrix, but rows and columns that still have a zero
+    # have a minimum of 0 and are left alone
+    # Time O(n) for each row and column that is reduced
+    def reduce_changed_lines(self):
+        rows = np.flatnonzero(self.unvisited_rows() & (self.row_zeros == 0))
+        row_minimums = self.matrix[rows].min(axis=1)
+        # a row with nowhere left to go means there is no tour from here (no need to continue reduction)
+        if np.isinf(row_minimums).any():
+            return math.inf
+        if len(rows) != 0:
+            self.matrix[rows] -= row_minimums[:, np.newaxis]
+            # reducing a row without zeros cannot take a zero away from any column, it only adds some
+            zeros = self.matrix[rows] == 0
+            self.row_zeros[rows] = zeros.sum(axis=1)
+            self.column_zeros += zeros.sum(axis=0)
+
+        columns = np.flatnonzero(self.unvisited_columns() & (self.column_zeros == 0))
+        column_minimums = self.matrix[:, columns].min(axis=0)
+        if np.isinf(column_minimums).any():
+            return math.inf
+        if len(columns) != 0:
+            self.matrix[:, columns] -= column_minimums[np.newaxis, :]
+            zeros = self.matrix[:, columns] == 0
+            self.column_zeros[columns] = zeros.sum(axis=0)
+            self.row_zeros += zeros.sum(axis=1)
+
+        return float(row_minimums.sum() + column_minimums.sum())
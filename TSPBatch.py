@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+
+import argparse
+import csv
+import inspect
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import numpy as np
+from TSPClasses import *
+from TSPSolver import TSPSolver
+
+
+''' <summary>
+	Runs the solvers without the GUI (nothing here imports Qt).  Scenarios are
+	generated from (size, seed, difficulty) the same way Proj5GUI does, so a seed
+	gives the same cities here as in the GUI.  From Python:
+
+		scenario = generate_scenario(20, 7, 'Hard (Deterministic)')
+		results = solve(scenario, 'branchAndBound', time_allowance=10.0, bound='one_tree')
+
+	From the command line, every combination of the sizes, seeds, difficulties and
+	algorithms given is run and written out as one result per line (JSON) or CSV:
+
+		python3 TSPBatch.py --size 15 20 --seed 1 2 3 --algorithm greedy branchAndBound \
+			--time 10 --option bound=one_tree --format csv
+
+	Many scenarios can be solved at once over a pool of processes with solve_many
+	(--workers on the command line), which hands back results as they finish.
+
+	compatible=True (--compatible) generates the scenarios exactly as they were
+	generated before scenario generation was vectorized, see TSPClasses.randomPoints.
+	</summary> '''
+
+
+# same as Proj5GUI.data_range
+DATA_RANGE = { 'x':[-1.5,1.5], 'y':[-1.0,1.0] }
+DIFFICULTIES = ['Easy', 'Normal', 'Hard', 'Hard (Deterministic)']
+
+# columns written for the CSV format (the JSON format writes every field of the results)
+RESULT_FIELDS = ['size', 'seed', 'difficulty', 'algorithm', 'time_allowance', 'cost', 'time',
+				 'count', 'max', 'total', 'pruned', 'bound', 'root_gap', 'route', 'trace']
+
+
+# the city locations Proj5GUI.newPoints makes for this size and seed, as a (size, 2) array
+def new_points( size, seed, compatible=False ):
+	return randomPoints( size, seed, DATA_RANGE, compatible )
+
+
+def generate_scenario( size, seed, difficulty, compatible=False ):
+	if difficulty not in DIFFICULTIES:
+		raise ValueError('Unsupported difficulty: {}'.format(difficulty))
+	# the solvers draw from random too, which compatible generation seeds and draws from as the GUI did
+	random.seed( seed )
+	points = new_points( size, seed, compatible )
+	# Hard mode removes edges with np.random, which the GUI never seeds; seed it here so runs repeat
+	np.random.seed( seed )
+	return Scenario( city_locations=points, difficulty=difficulty, rand_seed=seed, compatible=compatible )
+
+
+# names of the TSPSolver entry points, i.e. the methods that take a time_allowance
+def algorithm_names():
+	return [name for name, method in inspect.getmembers(TSPSolver, inspect.isfunction)
+			if not name.startswith('_') and 'time_allowance' in inspect.signature(method).parameters]
+
+
+# run one solver entry point by name, passing any options on to it
+def solve( scenario, algorithm, time_allowance=60.0, **options ):
+	if algorithm not in algorithm_names():
+		raise ValueError('Unsupported algorithm: {}'.format(algorithm))
+	solver = TSPSolver(None)
+	solver.setupWithScenario(scenario)
+	return getattr(solver, algorithm)(time_allowance=time_allowance, **options)
+
+
+# numpy numbers as plain ones, infinity (no solution) as None
+def _plain( value ):
+	if isinstance(value, (list, tuple)):
+		return [_plain(item) for item in value]
+	if isinstance(value, np.generic):
+		value = value.item()
+	if isinstance(value, float) and math.isinf(value):
+		return None
+	return value
+
+
+# the results dictionary of one run as a flat record, with the route as a list of city indices
+def result_record( size, seed, difficulty, algorithm, time_allowance, results ):
+	record = { 'size': size, 'seed': seed, 'difficulty': difficulty, 'algorithm': algorithm,
+			   'time_allowance': time_allowance }
+	for key, value in results.items():
+		if key != 'soln':
+			record[key] = _plain(value)
+	solution = results.get('soln')
+	record['route'] = solution.indices.tolist() if solution is not None else None
+	return record
+
+
+# names of the options (keyword arguments besides time_allowance) an algorithm takes
+def algorithm_options( algorithm ):
+	parameters = inspect.signature(getattr(TSPSolver, algorithm)).parameters
+	return [name for name in parameters if name not in ('self', 'time_allowance')]
+
+
+# every combination of the sizes, seeds, difficulties and algorithms as a spec for solve_many,
+# each algorithm only getting the options it takes
+def batch_specs( sizes, seeds, difficulties, algorithms, options, compatible=False ):
+	for option in options:
+		if not any(option in algorithm_options(algorithm) for algorithm in algorithms):
+			raise ValueError('None of the algorithms take the option {}'.format(option))
+	for size in sizes:
+		for seed in seeds:
+			for difficulty in difficulties:
+				for algorithm in algorithms:
+					accepted = algorithm_options(algorithm)
+					yield { 'size': size, 'seed': seed, 'difficulty': difficulty, 'algorithm': algorithm,
+							'compatible': compatible,
+							'options': { name: value for name, value in options.items() if name in accepted } }
+
+
+# yields the result record of every combination of batch_specs, one after another in this process
+def run_batch( sizes, seeds, difficulties, algorithms, time_allowance=60.0, compatible=False, **options ):
+	for spec in batch_specs( sizes, seeds, difficulties, algorithms, options, compatible ):
+		# a fresh scenario for every run, so each one starts from the same random state
+		index, record = _solve_task( 0, _task(spec, spec['algorithm'], time_allowance, {}) )
+		yield record
+
+
+''' <summary>
+	Solve many scenarios over a pool of worker processes.  Each spec is a
+	(size, seed, difficulty) tuple, a Scenario, or a dict with either 'scenario' or
+	'size', 'seed', 'difficulty' (and 'compatible'), and optionally its own
+	'algorithm', 'time_allowance' and 'options' in place of the arguments given here.  Specs
+	given as (size, seed, difficulty) are generated in the worker, so only the tuple
+	is sent; Scenarios are sent in their compact pickled form (see
+	Scenario.__getstate__).
+	</summary>
+	<returns>(index of the spec, result record) pairs, in the order the scenarios are
+	solved.  specs is read lazily and at most max_in_flight tasks (default twice the
+	number of workers) are handed out at a time, so neither the specs nor the results
+	pile up in memory.</returns> '''
+
+def solve_many( specs, algorithm='greedy', time_allowance=60.0, workers=None, max_in_flight=None, **options ):
+	if workers is None:
+		workers = os.cpu_count() or 1
+	if max_in_flight is None:
+		max_in_flight = 2 * workers
+	finished = queue.Queue()
+	tasks = ( (index, _task(spec, algorithm, time_allowance, options)) for index, spec in enumerate(specs) )
+	with multiprocessing.Pool(workers) as pool:
+		in_flight = 0
+		while True:
+			# top up the tasks in flight, then wait for one of them
+			for index, task in itertools.islice(tasks, max_in_flight - in_flight):
+				pool.apply_async(_solve_task, (index, task), callback=finished.put, error_callback=finished.put)
+				in_flight += 1
+			if in_flight == 0:
+				break
+			result = finished.get()
+			in_flight -= 1
+			if isinstance(result, BaseException):
+				raise result
+			yield result
+
+
+# one spec of solve_many as a dict with everything the worker needs
+def _task( spec, algorithm, time_allowance, options ):
+	if isinstance(spec, Scenario):
+		spec = { 'scenario': spec }
+	elif isinstance(spec, (tuple, list)):
+		size, seed, difficulty = spec
+		spec = { 'size': size, 'seed': seed, 'difficulty': difficulty }
+	task = { 'algorithm': algorithm, 'time_allowance': time_allowance }
+	task.update(spec)
+	task['options'] = dict(options, **spec.get('options', {}))
+	return task
+
+
+def _solve_task( index, task ):
+	if 'scenario' in task:
+		scenario = task['scenario']
+		size = len(scenario.getCities())
+		difficulty = scenario._difficulty
+	else:
+		size, difficulty = task['size'], task['difficulty']
+		scenario = generate_scenario( size, task['seed'], difficulty, task.get('compatible', False) )
+	results = solve( scenario, task['algorithm'], task['time_allowance'], **task['options'] )
+	return index, result_record( size, task.get('seed'), difficulty, task['algorithm'], task['time_allowance'], results )
+
+
+# NAME=VALUE, with VALUE read as JSON when it can be (numbers, true/false, null) and as a string otherwise
+def _parse_option( text ):
+	name, separator, value = text.partition('=')
+	if separator == '':
+		raise argparse.ArgumentTypeError('expected NAME=VALUE, got {}'.format(text))
+	try:
+		value = json.loads(value)
+	except ValueError:
+		pass
+	return name, value
+
+
+def main( argv=None ):
+	parser = argparse.ArgumentParser(description='Solve generated TSP scenarios without the GUI.')
+	parser.add_argument('--size', type=int, nargs='+', required=True, help='number of cities')
+	parser.add_argument('--seed', type=int, nargs='+', default=[20], help='random seed (as in the GUI)')
+	parser.add_argument('--difficulty', nargs='+', default=['Hard (Deterministic)'], choices=DIFFICULTIES)
+	parser.add_argument('--algorithm', nargs='+', default=['greedy'], choices=algorithm_names())
+	parser.add_argument('--time', type=float, default=60.0, help='time allowance per run, in seconds')
+	parser.add_argument('--option', type=_parse_option, action='append', default=[], metavar='NAME=VALUE',
+						help='extra keyword argument for the algorithm, e.g. bound=one_tree')
+	parser.add_argument('--format', choices=['json', 'csv'], default='json',
+						help='json writes one object per line')
+	parser.add_argument('--output', help='file to write to instead of standard output')
+	parser.add_argument('--workers', type=int,
+						help='solve over this many processes, writing results as they finish')
+	parser.add_argument('--compatible', action='store_true',
+						help='generate the scenarios exactly as before generation was vectorized')
+	args = parser.parse_args(argv)
+
+	out = open(args.output, 'w', newline='') if args.output else sys.stdout
+	try:
+		if args.format == 'csv':
+			writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+			writer.writeheader()
+		if args.workers is None:
+			records = run_batch(args.size, args.seed, args.difficulty, args.algorithm, args.time, args.compatible,
+								**dict(args.option))
+		else:
+			specs = batch_specs(args.size, args.seed, args.difficulty, args.algorithm, dict(args.option),
+								args.compatible)
+			records = (record for index, record in solve_many(specs, time_allowance=args.time, workers=args.workers))
+		for record in records:
+			if args.format == 'csv':
+				writer.writerow({ key: json.dumps(value) if isinstance(value, list) else value
+								  for key, value in record.items() })
+			else:
+				out.write(json.dumps(record) + '\n')
+			out.flush()
+	finally:
+		if out is not sys.stdout:
+			out.close()
+
+
+if __name__ == '__main__':
+	main()
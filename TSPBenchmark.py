@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import math
+import sys
+from TSPBatch import DIFFICULTIES, run_batch
+
+
+''' <summary>
+	Benchmark suite: every algorithm in BENCHMARK_CASES on its city counts, all four
+	difficulties and the fixed BENCHMARK_SEEDS (scenarios and solver randomness are
+	seeded through TSPBatch, so the runs repeat).  Each (algorithm, size, difficulty)
+	group reports the mean cost, wall time, states created, pruned states and max
+	queue size over the seeds.
+
+	Save a baseline, then compare later runs against it; a group that got more
+	expensive or slower than the tolerances below is flagged as a regression and
+	the exit status is 1:
+
+		python3 TSPBenchmark.py --save-baseline bench_baseline.json
+		python3 TSPBenchmark.py --baseline bench_baseline.json > bench_output.txt
+	</summary> '''
+
+
+BENCHMARK_SEEDS = [1, 2, 3]
+BENCHMARK_TIME_ALLOWANCE = 10.0
+# (algorithm, city counts, options); defaultRandomTour and branchAndBound only get small
+# problems, random tours are hardly ever complete on big Hard problems
+BENCHMARK_CASES = [
+	('defaultRandomTour', [10, 15, 20], {}),
+	('greedy', [10, 50, 200, 1000], {}),
+	('branchAndBound', [10, 12, 14], {}),
+	# the optimal costs, to compare the others with
+	('heldKarp', [10, 12, 14], {}),
+	('fancy', [10, 50, 200, 1000], {}),
+	# a fixed number of kicks, moves, generations and iterations, otherwise these always run for
+	# the whole time allowance
+	('linKernighan', [10, 50, 200], {'max_kicks': 100}),
+	('simulatedAnnealing', [10, 50, 200], {'max_moves': 200000}),
+	('genetic', [10, 50, 200], {'max_generations': 500}),
+	('antColony', [10, 50, 200], {'max_iterations': 50}),
+]
+
+# the fields averaged over the seeds of a group
+SUMMARY_FIELDS = ['cost', 'time', 'total', 'pruned', 'max']
+
+# a group regresses when its mean cost grows by more than this fraction ...
+COST_TOLERANCE = 0.001
+# ... or its mean time grows by more than this fraction and by at least MIN_TIME_DIFFERENCE seconds
+TIME_TOLERANCE = 0.25
+MIN_TIME_DIFFERENCE = 0.01
+
+
+def group_key( algorithm, size, difficulty ):
+	return '{}/{}/{}'.format(algorithm, size, difficulty)
+
+
+# run the suite, returning every run's record and the per group means
+def run_benchmark( cases=BENCHMARK_CASES, seeds=BENCHMARK_SEEDS, time_allowance=BENCHMARK_TIME_ALLOWANCE,
+				   difficulties=DIFFICULTIES, progress=None ):
+	records = []
+	summary = {}
+	for algorithm, sizes, options in cases:
+		for size in sizes:
+			for difficulty in difficulties:
+				group = list(run_batch([size], seeds, [difficulty], [algorithm], time_allowance, **options))
+				records += group
+				summary[group_key(algorithm, size, difficulty)] = summarize(group)
+				if progress is not None:
+					progress(group_key(algorithm, size, difficulty), summary[group_key(algorithm, size, difficulty)])
+	return { 'seeds': seeds, 'time_allowance': time_allowance, 'records': records, 'summary': summary }
+
+
+# mean of every summary field over the records of one group; None (no solution, or a field the
+# algorithm does not fill in) in any record makes the mean None
+def summarize( records ):
+	means = {}
+	for field in SUMMARY_FIELDS:
+		values = [record.get(field) for record in records]
+		means[field] = None if any(value is None for value in values) else sum(values) / len(values)
+	return means
+
+
+# compare the per group means with a baseline benchmark, returning (key, message, regressed) for every
+# group found in both
+def compare( summary, baseline_summary ):
+	comparisons = []
+	for key, means in summary.items():
+		if key not in baseline_summary:
+			continue
+		baseline = baseline_summary[key]
+		messages = []
+		regressed = False
+
+		# a missing cost means no solution was found, which is worse than any cost
+		cost = math.inf if means['cost'] is None else means['cost']
+		baseline_cost = math.inf if baseline['cost'] is None else baseline['cost']
+		if cost > baseline_cost * (1 + COST_TOLERANCE):
+			regressed = True
+			messages.append('cost {} -> {}'.format(baseline['cost'], means['cost']))
+		elif cost < baseline_cost:
+			messages.append('cost improved {} -> {}'.format(baseline['cost'], means['cost']))
+
+		time, baseline_time = means['time'], baseline['time']
+		if time > baseline_time * (1 + TIME_TOLERANCE) and time - baseline_time >= MIN_TIME_DIFFERENCE:
+			regressed = True
+			messages.append('time {:.4f}s -> {:.4f}s'.format(baseline_time, time))
+		elif baseline_time > time * (1 + TIME_TOLERANCE) and baseline_time - time >= MIN_TIME_DIFFERENCE:
+			messages.append('time improved {:.4f}s -> {:.4f}s ({:.1f}x)'.format(baseline_time, time, baseline_time / time))
+
+		comparisons.append((key, ', '.join(messages), regressed))
+	return comparisons
+
+
+def _format_means( key, means ):
+	def number( value, spec ):
+		return '-' if value is None else format(value, spec)
+	return '{:<45} cost {:>12} time {:>9}s states {:>10} pruned {:>10} max {:>8}'.format(
+		key, number(means['cost'], '.1f'), number(means['time'], '.4f'), number(means['total'], '.0f'),
+		number(means['pruned'], '.0f'), number(means['max'], '.0f'))
+
+
+def main( argv=None ):
+	parser = argparse.ArgumentParser(description='Run the TSP benchmark suite.')
+	parser.add_argument('--algorithm', nargs='+', help='only benchmark these algorithms')
+	parser.add_argument('--seed', type=int, nargs='+', default=BENCHMARK_SEEDS)
+	parser.add_argument('--time', type=float, default=BENCHMARK_TIME_ALLOWANCE, help='time allowance per run')
+	parser.add_argument('--output', help='write every run and the group means to this JSON file')
+	parser.add_argument('--save-baseline', help='write the results to this JSON file as the new baseline')
+	parser.add_argument('--baseline', help='compare with the baseline in this JSON file')
+	args = parser.parse_args(argv)
+
+	cases = [case for case in BENCHMARK_CASES if args.algorithm is None or case[0] in args.algorithm]
+	benchmark = run_benchmark(cases, args.seed, args.time,
+							  progress=lambda key, means: print(_format_means(key, means), flush=True))
+	for path in (args.output, args.save_baseline):
+		if path is not None:
+			with open(path, 'w') as file:
+				json.dump(benchmark, file, indent=1)
+
+	regressions = 0
+	if args.baseline is not None:
+		with open(args.baseline) as file:
+			baseline = json.load(file)
+		if baseline['seeds'] != benchmark['seeds'] or baseline['time_allowance'] != benchmark['time_allowance']:
+			print('warning: the baseline was run with different seeds or time allowance')
+		print()
+		for key, message, regressed in compare(benchmark['summary'], baseline['summary']):
+			if message:
+				print('{:<9} {:<45} {}'.format('REGRESSED' if regressed else 'ok', key, message))
+			regressions += regressed
+		print('{} regression(s)'.format(regressions))
+	return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
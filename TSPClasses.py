@@ -1,42 +1,57 @@
 #!/usr/bin/python3
 
 
+import itertools
 import math
 import numpy as np
 import random
+import string
 import time
 
 
 
 class TSPSolution:
-	def __init__( self, listOfCities):
-		self.route = listOfCities
+	# route is a list of City objects, or an array of city indices (a permutation) of the scenario given
+	def __init__( self, route, scenario=None ):
+		# the route is kept as an array of city indices; route gives it back as City views
+		if scenario is None:
+			self._scenario = route[0]._scenario
+			self.indices = np.array( [city._index for city in route], dtype=int )
+		else:
+			self._scenario = scenario
+			self.indices = np.array( route, dtype=int )
+		# the cost of every edge of the tour, edge i going from indices[i] to indices[i+1] (and back to the start)
+		self._edge_costs = self._scenario.edgeCosts( self.indices, np.roll( self.indices, -1 ) )
 		self.cost = self._costOfRoute()
-		#print( [c._index for c in listOfCities] )
+
+	@property
+	def route( self ):
+		cities = self._scenario.getCities()
+		return [cities[i] for i in self.indices.tolist()]
 
 	def _costOfRoute( self ):
-		cost = 0
-		last = self.route[0]
-		for city in self.route[1:]:
-			cost += last.costTo(city)
-			last = city
-		cost += self.route[-1].costTo( self.route[0] )
-		return cost
+		cost = self._edge_costs.sum()
+		if cost == np.inf:
+			return np.inf
+		return int(cost)
+
+	# are all the edges of the tour there (Hard scenarios are missing some)?
+	def isFeasible( self ):
+		return self.cost != np.inf
+
+	# the edges of the tour as arrays (sources, destinations, costs) of city indices and whole costs,
+	# None if the tour is missing an edge
+	def edgeArrays( self ):
+		if not self.isFeasible():
+			return None
+		return self.indices, np.roll( self.indices, -1 ), self._edge_costs.astype( int )
 
 	def enumerateEdges( self ):
-		elist = []
-		c1 = self.route[0]
-		for c2 in self.route[1:]:
-			dist = c1.costTo( c2 )
-			if dist == np.inf:
-				return None
-			elist.append( (c1, c2, int(math.ceil(dist))) )
-			c1 = c2
-		dist = self.route[-1].costTo( self.route[0] )
-		if dist == np.inf:
+		edges = self.edgeArrays()
+		if edges is None:
 			return None
-		elist.append( (self.route[-1], self.route[0], int(math.ceil(dist))) )
-		return elist
+		cities = self._scenario.getCities()
+		return [(cities[src], cities[dst], cost) for src, dst, cost in zip( *(edge.tolist() for edge in edges) )]
 
 
 def nameForInt( num ):
@@ -47,6 +62,148 @@ def nameForInt( num ):
 	else:
 		return nameForInt((num-1) // 26 ) + nameForInt((num-1)%26+1)
 
+# the names of cities 0..count-1, nameForInt(index+1) for each: A ... Z, AA ... ZZ, AAA ...
+def cityNames( count ):
+	names = []
+	length = 1
+	while len(names) < count:
+		combinations = itertools.product( string.ascii_uppercase, repeat=length )
+		names.extend( ''.join(letters) for letters in itertools.islice( combinations, count - len(names) ) )
+		length += 1
+	return names
+
+
+''' <summary>
+	Scenarios are generated with array operations.  With compatible=True they come
+	out exactly as the one-number-at-a-time generation always made them (and leave
+	the random and np.random states where it did): numpy's MT19937 is the same
+	generator as the random module's, so random's state is handed to a RandomState,
+	drawn from in bulk and handed back.  Otherwise, the cities still come from the
+	stream random.seed(seed) starts (for any int seed, see _seedState), but the
+	elevations and Hard (Deterministic) edges come from streams of their own, keyed
+	by the seed and ELEVATION_STREAM or EDGE_STREAM, which do not depend on anything
+	drawn before.  A seed of None draws from an unseeded generator.
+	</summary> '''
+
+ELEVATION_STREAM = 1
+EDGE_STREAM = 2
+
+# RandomState for the seed (any int, or None for an unseeded one), followed by the stream numbers given:
+# random.seed keys the generator with the 32 bit words of abs(seed), lowest first, so with no stream
+# numbers this is the stream random.seed(seed) starts
+def _seedState( seed, *streams ):
+	if seed is None:
+		return np.random.RandomState()
+	seed = abs( int(seed) )
+	key = []
+	while True:
+		key.append( seed & 0xffffffff )
+		seed >>= 32
+		if seed == 0:
+			break
+	return np.random.RandomState( key + list(streams) )
+
+# the random module's state as a RandomState, and back
+def _pythonRandomState():
+	version, internal, gauss = random.getstate()
+	state = np.random.RandomState()
+	state.set_state( ('MT19937', np.array( internal[:-1], dtype=np.uint32 ), internal[-1]) )
+	return state
+
+def _setPythonRandomState( state ):
+	name, keys, pos = state.get_state()[:3]
+	version, internal, gauss = random.getstate()
+	random.setstate( (version, tuple( keys.tolist() ) + (int(pos),), gauss) )
+
+# count numbers, the same as count calls to random.random()
+def _pythonRandom( count ):
+	state = _pythonRandomState()
+	values = state.random_sample( count )
+	_setPythonRandomState( state )
+	return values
+
+# (size, 2) array of city locations spread uniformly over data_range, the ones Proj5GUI.newPoints
+# has always made for the seed
+def randomPoints( size, seed, data_range, compatible=False ):
+	if compatible:
+		random.seed( seed )
+		uniform = _pythonRandom( 2*size )
+	else:
+		uniform = _seedState( seed ).random_sample( 2*size )
+	uniform = uniform.reshape( (size,2) )
+	xr = data_range['x']
+	yr = data_range['y']
+	return np.stack( (xr[0] + (xr[1]-xr[0])*uniform[:,0], yr[0] + (yr[1]-yr[0])*uniform[:,1]), axis=1 )
+
+
+# Random (src,dst) pairs as flat indices src*ncities+dst for Scenario.thinEdges: draw(count) gives the
+# next count pairs, finish(used) leaves the generator just after the first used pairs, as if only those
+# had been drawn.
+
+# from a RandomState (or np.random itself), as np.random.randint(ncities) twice per pair
+def _numpyPairDraws( state, ncities ):
+	start = state.get_state()
+	def draw( count ):
+		values = state.randint( ncities, size=2*count )
+		return values[0::2]*ncities + values[1::2]
+	def finish( used ):
+		state.set_state( start )
+		state.randint( ncities, size=2*used )
+	return draw, finish
+
+# from the random module, as random.randint(0,ncities-1) twice per pair: every number is the top
+# bits of one 32 bit output, tried again while it is ncities or more
+def _pythonPairDraws( ncities ):
+	state = _pythonRandomState()
+	start = state.get_state()
+	shift = 32 - ncities.bit_length()
+	pending = [np.empty( 0, dtype=np.int64 )]
+	def numbers( words ):
+		return state.randint( 0, 2**32, size=words, dtype=np.uint32 ).astype( np.int64 ) >> shift
+	def draw( count ):
+		values = pending[0]
+		while len(values) < 2*count:
+			drawn = numbers( 2*(2*count - len(values)) + 64 )
+			values = np.concatenate( (values, drawn[drawn < ncities]) )
+		pending[0] = values[2*count:]
+		return values[0:2*count:2]*ncities + values[1:2*count:2]
+	def finish( used ):
+		# count the outputs the first used pairs took, then draw exactly that many from the start
+		state.set_state( start )
+		needed = 2*used
+		words = 0
+		while needed > 0:
+			drawn = numbers( 2*needed + 64 )
+			accepted = np.flatnonzero( drawn < ncities )
+			if len(accepted) >= needed:
+				words += accepted[needed-1] + 1
+				break
+			needed -= len(accepted)
+			words += len(drawn)
+		state.set_state( start )
+		state.randint( 0, 2**32, size=words, dtype=np.uint32 )
+		_setPythonRandomState( state )
+	return draw, finish
+
+# Flags the first count distinct indices drawn that are deletable, the same edges a loop drawing
+# one pair at a time and removing it if it still can be would remove.
+# Returns (the flags, how many pairs that loop would have drawn)
+def _firstDistinct( deletable, count, draw ):
+	taken = np.zeros( len(deletable), dtype=bool )
+	used = 0
+	remaining = count
+	while remaining > 0:
+		batch = min( max( 2*remaining, 1024 ), 2**22 )
+		flat = draw( batch )
+		positions = np.flatnonzero( deletable[flat] & ~taken[flat] )
+		candidates = flat[positions]
+		# the first time each edge comes up, in the order drawn
+		first = np.sort( np.unique( candidates, return_index=True )[1] )[:remaining]
+		taken[candidates[first]] = True
+		remaining -= len(first)
+		used += positions[first[-1]] + 1 if remaining == 0 else batch
+	return taken, used
+
 
 
 
@@ -58,41 +215,131 @@ class Scenario:
 
 	HARD_MODE_FRACTION_TO_REMOVE = 0.20 # Remove 20% of the edges
 
-	def __init__( self, city_locations, difficulty, rand_seed ):
+	''' <summary>
+		Cities are stored as arrays, coordinates (ncities x 2) and elevations, and
+		named by index (see nameForInt).  getCities hands out City views of them,
+		made when asked for, and the cost matrix is only built the first time a
+		solver asks for it, so a big scenario costs O(n) until then.  Easy and
+		Normal scenarios have every edge, so only Hard ones keep an edge mask.
+		</summary> '''
+
+	# city_locations is a list of points (anything with x() and y(), like QPointF) or an (ncities, 2) array;
+	# see randomPoints for compatible
+	def __init__( self, city_locations, difficulty, rand_seed, compatible=False ):
 		self._difficulty = difficulty
 
-		if difficulty == "Normal" or difficulty == "Hard":
-			self._cities = [City( pt.x(), pt.y(), \
-								  random.uniform(0.0,1.0) \
-								) for pt in city_locations]
-		elif difficulty == "Hard (Deterministic)":
-			random.seed( rand_seed )
-			self._cities = [City( pt.x(), pt.y(), \
-								  random.uniform(0.0,1.0) \
-								) for pt in city_locations]
+		if isinstance( city_locations, np.ndarray ):
+			self._coordinates = np.array( city_locations, dtype=float ).reshape( (-1,2) )
 		else:
-			self._cities = [City( pt.x(), pt.y() ) for pt in city_locations]
-
+			self._coordinates = np.array( [(pt.x(), pt.y()) for pt in city_locations], dtype=float ).reshape( (-1,2) )
+		ncities = len(self._coordinates)
 
-		num = 0
-		for city in self._cities:
-			#if difficulty == "Hard":
-			city.setScenario(self)
-			city.setIndexAndName( num, nameForInt( num+1 ) )
-			num += 1
+		if difficulty == "Normal" or difficulty == "Hard" or difficulty == "Hard (Deterministic)":
+			if not compatible:
+				self._elevations = _seedState( rand_seed, ELEVATION_STREAM ).random_sample( ncities )
+			else:
+				# Normal and Hard go on from wherever random is, after the GUI drew the city locations
+				if difficulty == "Hard (Deterministic)":
+					random.seed( rand_seed )
+				self._elevations = _pythonRandom( ncities )
+		else:
+			self._elevations = np.zeros( ncities )
 
-		# Assume all edges exists except self-edges
-		ncities = len(self._cities)
-		self._edge_exists = ( np.ones((ncities,ncities)) - np.diag( np.ones((ncities)) ) ) > 0
+		self._cities = Cities( self )
+		# None while every edge exists (except self-edges)
+		self._edge_exists = None
+		self._cost_matrix = None
 
 		if difficulty == "Hard":
-			self.thinEdges()
+			self.thinEdges(compatible=compatible)
 		elif difficulty == "Hard (Deterministic)":
-			self.thinEdges(deterministic=True)
+			self.thinEdges(deterministic=True, compatible=compatible, rand_seed=rand_seed)
 
 	def getCities( self ):
 		return self._cities
 
+	# (ncities, 2) array of the city locations
+	def getCoordinates( self ):
+		return self._coordinates
+
+	def getElevations( self ):
+		return self._elevations
+
+	def cityName( self, index ):
+		return nameForInt( index+1 )
+
+	''' <summary>
+		Pickle a scenario compactly: city coordinates and elevations as arrays and the
+		edges, if some are missing, as bits.  The cost matrix is rebuilt when it is
+		next asked for, so sending a scenario to another process costs O(n) floats
+		and at most n^2 bits.
+		</summary> '''
+	def __getstate__( self ):
+		return { 'difficulty': self._difficulty,
+				 'coordinates': self._coordinates,
+				 'elevations': self._elevations,
+				 'edges': np.packbits( self._edge_exists ) if self._edge_exists is not None else None }
+
+	def __setstate__( self, state ):
+		self._difficulty = state['difficulty']
+		self._coordinates = state['coordinates']
+		self._elevations = state['elevations']
+		self._cities = Cities( self )
+		ncities = len(self._coordinates)
+		self._edge_exists = None
+		if state['edges'] is not None:
+			self._edge_exists = np.unpackbits( state['edges'], count=ncities*ncities ).reshape( (ncities,ncities) ) > 0
+		self._cost_matrix = None
+
+	''' <summary>
+		The (ncities x ncities) matrix of City.costTo values: entry [i,j] is the cost
+		of travelling from city i to city j.  Costs are whole numbers, but the matrix
+		is float so that missing edges (and self-edges) can be np.inf.
+		</summary> '''
+	def getCostMatrix( self ):
+		if self._cost_matrix is None:
+			self._cost_matrix = self._buildCostMatrix()
+		return self._cost_matrix
+
+	def _buildCostMatrix( self ):
+		ncities = len(self._coordinates)
+		cost = self._costs( np.arange( ncities )[:,np.newaxis], np.arange( ncities )[np.newaxis,:] )
+		if self._edge_exists is not None:
+			cost[~self._edge_exists] = np.inf
+		else:
+			np.fill_diagonal( cost, np.inf )
+		return cost
+
+	# costs from cities src to cities dst (index arrays, broadcast together), for edges that exist
+	def _costs( self, src, dst ):
+		xs = self._coordinates[:,0]
+		ys = self._coordinates[:,1]
+
+		# Euclidean Distance
+		cost = np.sqrt( (xs[dst] - xs[src])**2 + (ys[dst] - ys[src])**2 )
+
+		# Same asymmetric elevation cost as City.costTo (zero in easy mode)
+		if not self._difficulty == 'Easy':
+			cost += self._elevations[dst] - self._elevations[src]
+			np.maximum( cost, 0.0, out=cost )
+
+		return np.ceil( cost * City.MAP_SCALE )
+
+	# the costs of the edges from cities src to cities dst (index arrays), np.inf where there is no edge;
+	# looked up in the cost matrix once it has been built, and worked out from the cities until then
+	def edgeCosts( self, src, dst ):
+		if self._cost_matrix is not None:
+			return self._cost_matrix[src, dst]
+		src, dst = np.broadcast_arrays( np.asarray( src, dtype=int ), np.asarray( dst, dtype=int ) )
+		shape = src.shape
+		src, dst = src.reshape(-1), dst.reshape(-1)
+		cost = self._costs( src, dst )
+		if self._edge_exists is not None:
+			cost[~self._edge_exists[src, dst]] = np.inf
+		else:
+			cost[src == dst] = np.inf
+		return cost.reshape( shape )
+
 
 	def randperm( self, n ):				#isn't there a numpy function that does this and even gets called in Solver?
 		perm = np.arange(n)
@@ -103,50 +350,90 @@ class Scenario:
 			perm[randind] = save
 		return perm
 
-	def thinEdges( self, deterministic=False ):
-		ncities = len(self._cities)
+	# Remove HARD_MODE_FRACTION_TO_REMOVE of the edges at random, drawing (src,dst) pairs and
+	# removing the ones that are still there, in batches of pairs at a time
+	def thinEdges( self, deterministic=False, compatible=False, rand_seed=None ):
+		ncities = len(self._coordinates)
 		edge_count = ncities*(ncities-1) # can't have self-edge
-		num_to_remove = np.floor(self.HARD_MODE_FRACTION_TO_REMOVE*edge_count)
+		num_to_remove = int( np.floor(self.HARD_MODE_FRACTION_TO_REMOVE*edge_count) )
 
+		self._edge_exists = ~np.eye( ncities, dtype=bool )
 		can_delete	= self._edge_exists.copy()
 
 		# Set aside a route to ensure at least one tour exists
-		route_keep = np.random.permutation( ncities )
-		if deterministic:
+		if deterministic and compatible:
+			# np.random.permutation was always drawn first, even though the deterministic route replaces it
+			np.random.permutation( ncities )
 			route_keep = self.randperm( ncities )
-		for i in range(ncities):
-			can_delete[route_keep[i],route_keep[(i+1)%ncities]] = False
-
-		# Now remove edges until 
-		while num_to_remove > 0:
-			if deterministic:
-				src = random.randint(0,ncities-1)
-				dst = random.randint(0,ncities-1)
-			else:
-				src = np.random.randint(ncities)
-				dst = np.random.randint(ncities)
-			if self._edge_exists[src,dst] and can_delete[src,dst]:
-				self._edge_exists[src,dst] = False
-				num_to_remove -= 1
+			draw, finish = _pythonPairDraws( ncities )
+		elif deterministic:
+			state = _seedState( rand_seed, EDGE_STREAM )
+			route_keep = state.permutation( ncities )
+			draw, finish = _numpyPairDraws( state, ncities )
+		else:
+			route_keep = np.random.permutation( ncities )
+			draw, finish = _numpyPairDraws( np.random, ncities )
+		can_delete[route_keep, np.roll( route_keep, -1 )] = False
+
+		removed, used = _firstDistinct( can_delete.reshape(-1), num_to_remove, draw )
+		self._edge_exists[removed.reshape( (ncities,ncities) )] = False
+		if compatible:
+			finish( used )
+
+
+
+
+# the scenario's cities as a sequence of City views, made as they are asked for
+class Cities:
+	def __init__( self, scenario ):
+		self._scenario = scenario
+
+	def __len__( self ):
+		return len(self._scenario._coordinates)
 
+	def __getitem__( self, index ):
+		if isinstance( index, slice ):
+			return [City( self._scenario, i ) for i in range( *index.indices( len(self) ) )]
+		if index < 0:
+			index += len(self)
+		if not 0 <= index < len(self):
+			raise IndexError( 'city index out of range' )
+		return City( self._scenario, int(index) )
 
+	def __iter__( self ):
+		for index in range( len(self) ):
+			yield City( self._scenario, index )
 
 
+# A view of one of a scenario's cities
 class City:
-	def __init__( self, x, y, elevation=0.0 ):
-		self._x = x
-		self._y = y
-		self._elevation = elevation
-		self._scenario	= None
-		self._index = -1
-		self._name	= None
-
-	def setIndexAndName( self, index, name ):
+	__slots__ = ( '_scenario', '_index' )
+
+	def __init__( self, scenario, index ):
+		self._scenario	= scenario
 		self._index = index
-		self._name = name
 
-	def setScenario( self, scenario ):
-		self._scenario = scenario
+	@property
+	def _x( self ):
+		return float(self._scenario._coordinates[self._index,0])
+
+	@property
+	def _y( self ):
+		return float(self._scenario._coordinates[self._index,1])
+
+	@property
+	def _elevation( self ):
+		return float(self._scenario._elevations[self._index])
+
+	@property
+	def _name( self ):
+		return self._scenario.cityName( self._index )
+
+	def __eq__( self, other ):
+		return isinstance( other, City ) and self._scenario is other._scenario and self._index == other._index
+
+	def __hash__( self ):
+		return hash( (id(self._scenario), self._index) )
 
 	''' <summary>
 		How much does it cost to get from this city to the destination?
@@ -157,22 +444,10 @@ class City:
 	MAP_SCALE = 1000.0
 	def costTo( self, other_city ):
 
-		assert( type(other_city) == City )
-
-		# In hard mode, remove edges; this slows down the calculation...
-		# Use this in all difficulties, it ensures INF for self-edge
-		if not self._scenario._edge_exists[self._index, other_city._index]:
+		# See Scenario._costs: Euclidean distance, plus for Medium and Hard modes an
+		# asymmetric elevation cost (never below zero), and INF for self-edges and
+		# edges removed in hard mode.
+		cost = self._scenario.edgeCosts( self._index, other_city._index )
+		if cost == np.inf:
 			return np.inf
-
-		# Euclidean Distance
-		cost = math.sqrt( (other_city._x - self._x)**2 +
-						  (other_city._y - self._y)**2 )
-
-		# For Medium and Hard modes, add in an asymmetric cost (in easy mode it is zero).
-		if not self._scenario._difficulty == 'Easy':
-			cost += (other_city._elevation - self._elevation)
-			if cost < 0.0:
-				cost = 0.0					# Shouldn't it cost something to go downhill, no matter how steep??????
-
-
-		return int(math.ceil(cost * self.MAP_SCALE))
\ No newline at end of file
+		return int(cost)
@@ -1,31 +1,53 @@
 #!/usr/bin/python3
 
-from which_pyqt import PYQT_VER
-if PYQT_VER == 'PYQT5':
-	from PyQt5.QtCore import QLineF, QPointF
-elif PYQT_VER == 'PYQT4':
-	from PyQt4.QtCore import QLineF, QPointF
-else:
-	raise Exception('Unsupported Version of PyQt: {}'.format(PYQT_VER))
-
-
-
-
 import time
 import numpy as np
 from TSPClasses import *
 from State import *
+from Bounds import BOUNDS
+from Deadline import Deadline, merge_traces
+from LocalSearch import Tour, neighbor_lists, local_search
+from LinKernighan import MAX_DEPTH, iterated_lin_kernighan
+from SimulatedAnnealing import anneal
+from Genetic import POPULATION_SIZE, MUTATION_RATE, random_permutations, mutate, evolve
+from AntColony import ANTS, ALPHA, BETA, EVAPORATION, ant_colony
+from HeldKarp import held_karp, held_karp_bytes
 import heapq
 import itertools
+import functools
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
 
 
 
 class TSPSolver:
 	def __init__( self, gui_view ):
 		self._scenario = None
+		# only set in the worker processes of parallelBranchAndBound
+		self._shared_bssf_cost = None
+		self._bssf_callback = None
+		self._cancel_event = threading.Event()
 
 	def setupWithScenario( self, scenario ):
 		self._scenario = scenario
+		self._cancel_event.clear()
+
+	# callback(cost, route) is called (on the solving thread) with every new best solution
+	# of the running entry point, route being the list or array of its city indices
+	def setBSSFCallback( self, callback ):
+		self._bssf_callback = callback
+
+	# stop the running entry point (from another thread) as if its time was up;
+	# it still returns the best solution found so far
+	def cancel( self ):
+		self._cancel_event.set()
+
+	# time budget of an entry point, see Deadline
+	def _new_deadline( self, start_time, time_allowance ):
+		return Deadline(start_time, time_allowance, self._cancel_event, self._bssf_callback)
 
 
 	''' <summary>
@@ -36,29 +58,44 @@ class TSPSolver:
 		<returns>results dictionary for GUI that contains three ints: cost of solution, 
 		time spent to find solution, number of permutations tried during search, the 
 		solution found, and three null values for fields not used for this 
-		algorithm</returns> 
+		algorithm, plus the anytime trace: (elapsed seconds, cost) for every improvement
+		of the best solution</returns> 
 	'''
 	
+	# Permutations are drawn and checked a block at a time, as the rows of a 2D array, and the cheapest
+	# complete tour of the first block that has one is kept.  Blocks start at one permutation (the first
+	# random tour is nearly always complete on easier problems) and double up to about this many cost lookups,
+	# but never to more than is expected to fit in RANDOM_TOUR_TIME_FRACTION of the time left, going by how
+	# long the last block took, so that the run stops close to the deadline.
+	RANDOM_TOUR_BLOCK_SIZE = 2**20
+	RANDOM_TOUR_TIME_FRACTION = 0.5
+
 	def defaultRandomTour( self, time_allowance=60.0 ):
 		results = {}
-		cities = self._scenario.getCities()
-		ncities = len(cities)
+		ncities = len(self._scenario.getCities())
 		foundTour = False
 		count = 0
 		bssf = None
 		start_time = time.time()
-		while not foundTour and time.time()-start_time < time_allowance:
-			# create a random permutation
-			perm = np.random.permutation( ncities )
-			route = []
-			# Now build the route using the random permutation
-			for i in range( ncities ):
-				route.append( cities[ perm[i] ] )
-			bssf = TSPSolution(route)
-			count += 1
-			if bssf.cost < np.inf:
+		deadline = self._new_deadline(start_time, time_allowance)
+		max_block = max(1, self.RANDOM_TOUR_BLOCK_SIZE // ncities)
+		block = 1
+		while not foundTour and not deadline.expired():
+			block_start = time.time()
+			# create a block of random permutations, one per row
+			perms = random_permutations(block, ncities)
+			# the cost of every edge of every permutation at once, np.inf for the missing ones
+			costs = self._scenario.edgeCosts(perms, np.roll(perms, -1, axis=1)).sum(axis=1)
+			count += block
+			best = int(np.argmin(costs))
+			bssf = TSPSolution(perms[best], self._scenario)
+			if costs[best] < np.inf:
 				# Found a valid route
 				foundTour = True
+				deadline.record(bssf.cost, perms[best])
+			seconds_per_permutation = max(time.time() - block_start, 1e-9) / block
+			fits = int(self.RANDOM_TOUR_TIME_FRACTION * deadline.remaining() / seconds_per_permutation)
+			block = max(1, min(2 * block, max_block, fits))
 		end_time = time.time()
 		results['cost'] = bssf.cost if foundTour else math.inf
 		results['time'] = end_time - start_time
@@ -67,6 +104,7 @@ class TSPSolver:
 		results['max'] = None
 		results['total'] = None
 		results['pruned'] = None
+		results['trace'] = deadline.trace
 		return results
 
 
@@ -77,123 +115,115 @@ class TSPSolver:
 		initial BSSF.
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
-		time spent to find best solution, total number of solutions found, the best
-		solution found, and three null values for fields not used for this 
-		algorithm</returns> 
+		time spent to find best solution, number of start cities that led to a complete tour,
+		the best solution found, three null values for fields not used for this 
+		algorithm and the anytime trace</returns> 
 	'''
 
 	# starts from an arbitrary city, picks the shortest path available to an unvisited city,
 	# then picks the shortest path from that city to an unvisited city, etc., until it returns to the origin city.
 	# Note that for Hard problems, it is possible to reach a city which has no paths to any remaining unvisited cities
 	# (don't forget to check for a path from the last city back to the first to complete the cycle).
-	# In such cases, just restart with a different random seed.
+	# Instead of restarting from one random city at a time, we run from many start cities at once
+	# (all of them by default, unless that is too much work) and keep the best tour.
 
-	def greedy( self,time_allowance=60.0 ):
+	# when starts is not given, use as many start cities as fit in about this many cost lookups
+	GREEDY_MAX_WORK = 2**27
+	# number of cost matrix entries looked at per step of a block of start cities
+	GREEDY_BLOCK_SIZE = 2**22
+
+	def greedy( self,time_allowance=60.0, starts=None ):
 		# start timer
 		start_time = time.time()
-		# keep track of randomStartIndices in a set
-		randIndexSet = set()
-		# intialize helper_result to false to enter the while loop
-		helper_result = False
-		# continue to run the helper function until we receive a valid result (within time constraint)
-		# TIME: O(n^3)
-		# worst case the while loop will run n times (n  = number of cities)
-		# worst case the inner while loop will run n times to find index of city we haven't started from
-		# greedy_helper is O(n^2) time, which is called n times in the worst case.
-		# SPACE: O(n)
-		# greedy_helper is O(n) space, which is called n times in the worst case,
-		# but each time the old solution is erase, so the space is just O(n)
-		while helper_result == False and time.time()-start_time < time_allowance:
-			if not len(randIndexSet) < len(self._scenario.getCities()):
+		deadline = self._new_deadline(start_time, time_allowance)
+		ncities = len(self._scenario.getCities())
+		if starts is None:
+			starts = self.GREEDY_MAX_WORK // (ncities * ncities)
+		starts = min(max(1, starts), ncities)
+		# choose arbitrary start cities without repeats
+		start_indices = np.array(random.sample(range(ncities), starts))
+
+		best_route = None
+		best_cost = math.inf
+		feasible = 0
+		# TIME: O(starts * n^2), vectorized over a block of start cities at a time
+		# SPACE: O(block * n)
+		# the blocks start with a single start city and double in size, so that even a short
+		# time allowance gets a tour out of greedy
+		max_block = max(1, self.GREEDY_BLOCK_SIZE // ncities)
+		block = 1
+		first = 0
+		while first < starts:
+			if deadline.expired():
 				break
-			# choose arbitrary index to start from
-			randStartCityIndex = random.randint(0, len(self._scenario.getCities()) - 1)
-			# if the random index is in the set, select a new random index
-			while randStartCityIndex in randIndexSet:
-				randStartCityIndex = random.randint(0, len(self._scenario.getCities()) - 1)
-			# add the random index to the set
-			randIndexSet.add(randStartCityIndex)
-			# call helper function
-			# TIME: O(n^2) SPACE: O(n)
-			helper_result = self.greedy_helper(randStartCityIndex, start_time, time_allowance)
+			routes, costs = self.greedy_helper(start_indices[first:first + block], deadline)
+			first += block
+			block = min(block * 2, max_block)
+			feasible += len(costs)
+			if len(costs) != 0 and costs.min() < best_cost:
+				best_cost = costs.min()
+				best_route = routes[np.argmin(costs)]
+				deadline.record(int(best_cost), best_route)
 
 		end_time = time.time()
 		results = {}
 		# if we did not get a result back, set cost to infinity
-		if helper_result == False:
+		if best_route is None:
 			results['cost'] = math.inf
-			results['count'] = 0
 			results['soln'] = None
 		# if we did get a valid result, get cost, soln from TSPSolution object
 		else:
-			results['cost'] = helper_result.cost
-			results['count'] = 1
-			results['soln'] = helper_result
+			bssf = TSPSolution(best_route, self._scenario)
+			results['cost'] = bssf.cost
+			results['soln'] = bssf
+		results['count'] = feasible
 		# the remainder of our result set will be the same regardless of whether we received a successful result
 		results['time'] = end_time - start_time
 		results['max'] = None
 		results['total'] = None
 		results['pruned'] = None
+		results['trace'] = deadline.trace
 
 		return results
 
-	# Time Complexity is O(n^2). For each city in our partial path (n cities)
-	# we look at every other city to find the smallest cost
-	# Space Complexity is O(n) to store the route as an ordered array of cities
-	def greedy_helper( self, randStartCityIndex, start_time, time_allowance=60.0 ):
-		# get cities
-		cities = self._scenario.getCities()
-		# starting from arbitrary city
-		currCity = cities[randStartCityIndex]
-		# boolean to keep track of whether we have found a valid tour
-		foundTour = False
-		# set to make sure that we don't visit a city twice
-		citySet = set()
-		# route
-		# SPACE O(n)
-		route = []
-		# keep looping until path to all cities is found
-		# TIME while loop will run max n times, space is O(n)
-		while not foundTour and time.time()-start_time < time_allowance:
-			# variables to keep track of closest city and the distance to closest city
-			closestCity = None
-			costToClosestCity = math.inf
-
-			route.append(currCity)
-			citySet.add(currCity)
-
-			# if the set contains all cities, then we check to make sure the cost from the last city to the first city
-			if len(citySet) == len(cities):
-				if currCity.costTo(cities[randStartCityIndex]) != math.inf:
-					foundTour = True
-					# we do not add the first city to the route here because TSPSolver._costOfRoute
-					# will automatically add the cost from the last city to the first
-					break
-				else:
-					break
-			# loop through all cities, looking for closest city
-			# TIME O(n)
-			for city in cities:
-				if city not in citySet:
-					costToCity = currCity.costTo(city)
-					if (costToCity < costToClosestCity):
-						costToClosestCity = costToCity
-						closestCity = city
-
-			# after the loop, if the math.inf
-			if costToClosestCity == math.inf:
-				break
-
-			# set currCity equal to the closestCity for next iteration of while loop
-			currCity = closestCity
-
-		# if we have set tourFound equal to true in the while loop, we will return the TSPSolution object for that route
-		if foundTour == True:
-			# TIME O(n)
-			bssf = TSPSolution(route)
-			return bssf
-		else:
-			return False
+	# Run the greedy walk from every start city in start_indices in lockstep.
+	# Time Complexity is O(k*n^2) for k start cities. At each of the n steps we look at the whole
+	# cost matrix row of every walk's current city (masked to the unvisited cities) at once
+	# Space Complexity is O(k*n) for the routes and visited masks
+	# Returns the routes (one row per walk) and costs of the walks that made it back to their start city
+	def greedy_helper( self, start_indices, deadline ):
+		cost_matrix = self._scenario.getCostMatrix()
+		ncities = len(cost_matrix)
+		walks = np.arange(len(start_indices))
+		# SPACE O(k*n)
+		routes = np.empty((len(start_indices), ncities), dtype=int)
+		routes[:, 0] = start_indices
+		# mask to make sure that no walk visits a city twice
+		visited = np.zeros((len(start_indices), ncities), dtype=bool)
+		visited[walks, start_indices] = True
+		costs = np.zeros(len(start_indices))
+
+		for step in range(1, ncities):
+			if deadline.expired():
+				return routes[:0], costs[:0]
+			# costs from every walk's current city to the cities it has not visited, looking for closest city
+			# (ties go to the lowest index, like scanning the cities in order)
+			row_costs = cost_matrix[routes[:, step - 1]]
+			row_costs[visited] = math.inf
+			closest = np.argmin(row_costs, axis=1)
+			costs += row_costs[walks, closest]
+			routes[:, step] = closest
+			visited[walks, closest] = True
+			# walks stuck in a city with no path to an unvisited city are dropped
+			stuck = costs == math.inf
+			if stuck.any():
+				routes, visited, costs = routes[~stuck], visited[~stuck], costs[~stuck]
+				walks = np.arange(len(costs))
+
+		# check for a path from the last city back to the first to complete the cycle
+		costs += cost_matrix[routes[:, -1], routes[:, 0]]
+		complete = costs != math.inf
+		return routes[complete], costs[complete]
 	
 	
 	
@@ -203,12 +233,167 @@ class TSPSolver:
 		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
 		time spent to find best solution, total number solutions found during search (does
 		not include the initial BSSF), the best solution found, and three more ints: 
-		max queue size, total number of states created, and number of pruned states.</returns> 
+		max queue size, total number of states created, and number of pruned states.
+		It also names the lower bound used (bound, one of Bounds.BOUNDS) and the root
+		gap: how far the initial BSSF is above the bound of state zero, as a fraction
+		of the initial BSSF, and the anytime trace of (elapsed seconds, cost) for the
+		initial BSSF and every better solution found.
+
+		bound='assignment' is weak on symmetric (Easy) and nearly symmetric (Normal)
+		costs: the assignment relaxation is happy to pair cities off into 2-cycles, so
+		its bound is barely above 'reduced' and the search can expand many more states,
+		and on some instances run out of time before proving the optimum.  It pays off
+		on Hard instances; bound='one_tree' is the one to use on symmetric costs.
+
+		To run with a fixed memory budget, cap the queue with max_queue_size (states)
+		and/or max_queue_bytes.  When the queue goes over the cap its worst states are
+		either discarded (overflow='discard', counted as pruned, so the result may no
+		longer be optimal) or written to a temporary file (overflow='spill') and read
+		back once the queue runs dry.  The cap is checked after every state expanded
+		(dives included), so the queue only goes over it by the children of one state,
+		and max queue size reports the largest it got.  dive_every=k makes every k-th
+		popped state start a depth-first dive down its best children, which finds new
+		BSSFs quickly.</returns> 
 	'''
 		
-	def branchAndBound( self, time_allowance=60.0 ):
+	def branchAndBound( self, time_allowance=60.0, bound='reduced', max_queue_size=None,
+						max_queue_bytes=None, overflow='discard', dive_every=None ):
+		# start timer
+		start_time = time.time()
+		self.deadline = self._new_deadline(start_time, time_allowance)
+
+		# set up the counters, the initial bssf and a queue holding state zero
+		self.start_branch_and_bound(bound, max_queue_size, max_queue_bytes, overflow, dive_every)
+
+		# while the length of our queue is not zero
+		self.search_queue()
+
+		# if not all states are dequeued because of termination
+		# those states will be counted as pruned
+		self.drop_queue()
+
+		# stop time
+		end_time = time.time()
+		# organize results and return
+		results = {}
+		results['cost'] = self.bssf_cost()
+		results['count'] = self.number_of_solutions_found
+		results['soln'] = self.bssf
+		results['time'] = end_time - start_time
+		results['max'] = self.max_queue_size
+		results['total'] = self.number_of_states_created
+		results['pruned'] = self.number_of_pruned_states
+		results['bound'] = self.bound_strategy.name
+		results['root_gap'] = self.root_gap
+		results['trace'] = self.deadline.trace
+
+		return results
+
+
+	''' <summary>
+		Branch-and-bound spread over a pool of worker processes.  The queue is expanded
+		best-first until there are a few subproblems per worker; each worker then searches
+		the subtrees it is handed, and all of them prune against one shared bssf cost.
+		</summary>
+		<returns>results dictionary with the same fields as branchAndBound.  max queue
+		size is the queue size when the subproblems were handed out plus the largest queue
+		of every worker, i.e. an upper bound on the combined queue.</returns> 
+	'''
+
+	# number of subproblems to hand out per worker, so that workers that finish early pick up more
+	SUBPROBLEMS_PER_WORKER = 4
+	# seconds between checks for cancel() while waiting on the workers
+	RESULT_POLL_INTERVAL = 0.1
+	# seconds past the deadline to wait for the workers' last results before giving up on them
+	RESULT_GRACE_PERIOD = 1.0
+
+	def parallelBranchAndBound( self, time_allowance=60.0, workers=None, bound='reduced', max_queue_size=None,
+								max_queue_bytes=None, overflow='discard', dive_every=None ):
 		# start timer
 		start_time = time.time()
+		self.deadline = self._new_deadline(start_time, time_allowance)
+		if workers is None:
+			workers = os.cpu_count() or 1
+
+		self.start_branch_and_bound(bound, max_queue_size, max_queue_bytes, overflow, dive_every)
+
+		# expand the top of the tree here until there is enough work to go around
+		self.search_queue(stop_at_queue_size=workers * self.SUBPROBLEMS_PER_WORKER)
+
+		# every worker gets the same budget for its own queue
+		queue_settings = (self.queue_limit, self.overflow, self.dive_every)
+		# hand out the spilled states as well
+		self.queue_limit = None
+		while self.reload_spilled_states():
+			pass
+		if len(self.heap_list) != 0 and not self.deadline.expired():
+			# every worker reads and lowers the same bssf cost
+			shared_bssf_cost = multiprocessing.Value('d', self.bssf_cost())
+			subproblems = [state for key, state in sorted(self.heap_list)]
+			queue_size = len(self.heap_list)
+			self.heap_list = []
+			# subproblems not searched before the deadline count as pruned
+			unsearched = len(subproblems)
+			with multiprocessing.Pool(workers, initializer=_start_branch_and_bound_worker,
+									  initargs=(self._scenario, self.bound_strategy, queue_settings, shared_bssf_cost)) as pool:
+				worker_results = pool.imap_unordered(
+					functools.partial(_branch_and_bound_worker, start_time=start_time, time_allowance=time_allowance),
+					subproblems)
+				while True:
+					# the workers stop at the deadline too, and the subproblems not started by then come back at
+					# once, so keep collecting until they are all in; only cancel() (or workers that are far past
+					# the deadline) leaves the pool early, which terminates the workers
+					try:
+						route, count, worker_max, states_created, pruned_states, trace = \
+							worker_results.next(timeout=self.RESULT_POLL_INTERVAL)
+					except multiprocessing.TimeoutError:
+						if self._cancel_event.is_set() or \
+								time.time() >= self.deadline.end_time + self.RESULT_GRACE_PERIOD:
+							break
+						continue
+					except StopIteration:
+						break
+					if route is not None:
+						solution = TSPSolution(route, self._scenario)
+						if solution.cost < self.bssf_cost():
+							self.bssf = solution
+							self.deadline.record(solution.cost, route)
+					# the workers time their solutions from the same start time
+					self.deadline.trace = merge_traces([self.deadline.trace, trace])
+					self.number_of_solutions_found += count
+					queue_size += worker_max
+					self.number_of_states_created += states_created
+					self.number_of_pruned_states += pruned_states
+					unsearched -= 1
+			self.number_of_pruned_states += unsearched
+			self.max_queue_size = max(self.max_queue_size, queue_size)
+
+		# if not all states are dequeued because of termination
+		# those states will be counted as pruned
+		self.drop_queue()
+
+		# stop time
+		end_time = time.time()
+		# organize results and return
+		results = {}
+		results['cost'] = self.bssf_cost()
+		results['count'] = self.number_of_solutions_found
+		results['soln'] = self.bssf
+		results['time'] = end_time - start_time
+		results['max'] = self.max_queue_size
+		results['total'] = self.number_of_states_created
+		results['pruned'] = self.number_of_pruned_states
+		results['bound'] = self.bound_strategy.name
+		results['root_gap'] = self.root_gap
+		results['trace'] = self.deadline.trace
+
+		return results
+
+
+	def start_branch_and_bound(self, bound='reduced', max_queue_size=None, max_queue_bytes=None,
+							   overflow='discard', dive_every=None):
+		if overflow not in ('discard', 'spill'):
+			raise ValueError('Unsupported overflow policy: {}'.format(overflow))
 
 		# initialize variables that we will keep track of / return
 		self.number_of_solutions_found = 0 # YUP
@@ -218,105 +403,307 @@ class TSPSolver:
 
 		# run greedy to get an initial solution
 		# we will use bssf to keep track of the cost of the best solution and the cost
-		self.bssf = self.greedy()['soln']
+		self.bssf = self.greedy(self.deadline.remaining())['soln']
+		if self.bssf is not None:
+			self.deadline.record(self.bssf.cost, self.bssf.indices)
 
 		# get cities
 		cities = self._scenario.getCities()
 
-		# initialize empty matrix of size (number of cities x number of cities)
-		unreduced_cost_matrix = [[math.inf for i in range(len(cities))] for j in range(len(cities))]
-		# initialize state 0 by constructing 2D matrix
+		# initialize state 0 from the scenario's (number of cities x number of cities) cost matrix
 		# TIME O(n^2)
 		# SPACE O(n^2)
-		for i in range(len(cities)):
-			for j in range(len(cities)):
-				unreduced_cost_matrix[i][j] = cities[i].costTo(cities[j])
+		unreduced_cost_matrix = self._scenario.getCostMatrix()
 
 		# state zero is the only state that does not inherit from a parent state, so we pass in None
-		state_zero = State(None, None, None)
+		state_zero = State(None, None)
 		# select arbitrary start city
 		randStartCityIndex = random.randint(0, len(cities) - 1)
 		# ( this will become the from index when we start visiting cities )
-		state_zero.set_state_zero_matrix(unreduced_cost_matrix, cities, randStartCityIndex)
+		state_zero.set_state_zero_matrix(unreduced_cost_matrix, randStartCityIndex)
+		# tighten the lower bound with the selected strategy
+		self.bound_strategy = BOUNDS[bound](unreduced_cost_matrix)
+		self.bound_strategy.tighten(state_zero, self.bssf_cost())
+		# how far the initial bssf is above the bound of the whole problem
+		self.root_gap = None
+		if self.bssf_cost() != math.inf and state_zero.bound != math.inf:
+			self.root_gap = (self.bssf_cost() - state_zero.bound) / self.bssf_cost()
 		# increment number of states created
 		self.number_of_states_created += 1
-		# create a heap queue
-		self.heap_list = []
-		heapq.heapify(self.heap_list)
+
+		# every queued state holds about this much memory
+		self.queue_limit = max_queue_size
+		if max_queue_bytes is not None:
+			state_bytes = state_zero.matrix.nbytes + state_zero.row_zeros.nbytes + \
+						  state_zero.column_zeros.nbytes + state_zero.visited.nbytes + self.STATE_OVERHEAD_BYTES
+			bytes_limit = max(1, int(max_queue_bytes // state_bytes))
+			self.queue_limit = bytes_limit if self.queue_limit is None else min(self.queue_limit, bytes_limit)
+		self.overflow = overflow
+		self.dive_every = dive_every
+
 		# push state zero on the queue
-		heapq.heappush(self.heap_list, (state_zero.get_key(), state_zero))
+		self.start_queue(state_zero)
 
-		# while the length of our queue is not zero
-		while len(self.heap_list) != 0 and time.time()-start_time < time_allowance:
+
+	# create a heap queue holding just this state
+	def start_queue(self, state):
+		self.heap_list = []
+		heapq.heapify(self.heap_list)
+		heapq.heappush(self.heap_list, (state.get_key(), state))
+		self.number_of_pops = 0
+		# states written out by limit_queue, as (file offset, number of states) batches
+		self.spill_file = None
+		self.spill_batches = []
+		self.number_of_spilled_states = 0
+
+
+	# pop states until the queue is empty, self.deadline passes or (if given) the queue has grown to stop_at_queue_size
+	def search_queue(self, stop_at_queue_size=None):
+		while not self.deadline.expired():
+			# read spilled states back in once the queue is empty
+			if len(self.heap_list) == 0 and not self.reload_spilled_states():
+				break
+			if stop_at_queue_size is not None and len(self.heap_list) >= stop_at_queue_size:
+				break
 			# update max queue size
 			if len(self.heap_list) > self.max_queue_size:
 				self.max_queue_size = len(self.heap_list)
-			# call our pop_off function
 			key, state = heapq.heappop(self.heap_list)
-			self.pop_off(state)
+			# states that can no longer beat the bssf are left on the queue by prune()
+			# and thrown away here instead, counting them as pruned
+			if state.bound >= self.bssf_cost():
+				self.number_of_pruned_states += 1
+				continue
+			# call our pop_off function, which hands back the best child when we are diving
+			self.number_of_pops += 1
+			dive = self.dive_every is not None and (self.number_of_pops - 1) % self.dive_every == 0
+			state = self.pop_off(state, dive)
+			self.queue_grew()
+			# every step of a dive queues the siblings of the state it goes on with, so keep to the
+			# queue limit after each one rather than once the dive is over
+			while state is not None and not self.deadline.expired():
+				state = self.pop_off(state, dive)
+				self.queue_grew()
+			# a dive cut short by the time limit leaves its state for drop_queue to count
+			if state is not None:
+				heapq.heappush(self.heap_list, (state.get_key(), state))
+				self.queue_grew()
+
+	# note the size the queue has reached and cut it back to the queue limit
+	def queue_grew(self):
+		if len(self.heap_list) > self.max_queue_size:
+			self.max_queue_size = len(self.heap_list)
+		self.limit_queue()
+
+
+	# bytes of a queued state besides its numpy arrays
+	STATE_OVERHEAD_BYTES = 256
+	# when the queue grows past queue_limit, cut it back to this fraction of the limit
+	QUEUE_SHRINK_FRACTION = 0.75
+
+	def limit_queue(self):
+		if self.queue_limit is None or len(self.heap_list) <= self.queue_limit:
+			return
+		# a sorted list is still a heap, keep the front of it
+		self.heap_list.sort(key=lambda entry: entry[0])
+		keep = max(1, int(self.queue_limit * self.QUEUE_SHRINK_FRACTION))
+		dropped = [state for key, state in self.heap_list[keep:]]
+		del self.heap_list[keep:]
+		if self.overflow == 'spill':
+			# no need to keep the states that can no longer beat the bssf
+			bssf_cost = self.bssf_cost()
+			spilled = [state for state in dropped if state.bound < bssf_cost]
+			self.number_of_pruned_states += len(dropped) - len(spilled)
+			if len(spilled) != 0:
+				if self.spill_file is None:
+					self.spill_file = tempfile.TemporaryFile()
+				self.spill_file.seek(0, os.SEEK_END)
+				self.spill_batches.append((self.spill_file.tell(), len(spilled)))
+				pickle.dump(spilled, self.spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+				self.number_of_spilled_states += len(spilled)
+		else:
+			# discarded states are never searched, so they count as pruned
+			self.number_of_pruned_states += len(dropped)
 
-		# if not all states are dequeued because of termination
-		# those states will be counted as pruned
-		self.number_of_pruned_states += len(self.heap_list)
 
-		# stop time
-		end_time = time.time()
-		# organize results and return
-		results = {}
-		results['cost'] = self.bssf.cost
-		results['count'] = self.number_of_solutions_found
-		results['soln'] = self.bssf
-		results['time'] = end_time - start_time
-		results['max'] = self.max_queue_size
-		results['total'] = self.number_of_states_created
-		results['pruned'] = self.number_of_pruned_states
+	# move the most recently spilled batch back onto the queue, returns False if there is none
+	def reload_spilled_states(self):
+		if len(self.spill_batches) == 0:
+			return False
+		offset, count = self.spill_batches.pop()
+		self.spill_file.seek(offset)
+		states = pickle.load(self.spill_file)
+		self.spill_file.truncate(offset)
+		self.number_of_spilled_states -= count
+		for state in states:
+			heapq.heappush(self.heap_list, (state.get_key(), state))
+		self.limit_queue()
+		return True
+
+
+	# count everything still queued or spilled as pruned and let go of it
+	def drop_queue(self):
+		self.number_of_pruned_states += len(self.heap_list) + self.number_of_spilled_states
+		self.heap_list = []
+		self.spill_batches = []
+		self.number_of_spilled_states = 0
+		if self.spill_file is not None:
+			self.spill_file.close()
+			self.spill_file = None
 
-		return results
+
+	# cost of the best solution so far, including the ones other workers found in parallelBranchAndBound
+	def bssf_cost(self):
+		cost = self.bssf.cost if self.bssf else math.inf
+		if self._shared_bssf_cost is not None:
+			cost = min(cost, self._shared_bssf_cost.value)
+		return cost
 
 
-	def pop_off(self, parent_state):
+	# expand a state, or check the solution if it is a complete route
+	# when diving, the best child is returned instead of being put on the queue
+	def pop_off(self, parent_state, dive=False):
+		cities = self._scenario.getCities()
 		# if the state has all cities in the route
-		if len(parent_state.route_set_indices) == len(self._scenario.getCities()):
+		if parent_state.depth == len(cities):
 			# check that that the cost from the last to the first is not infinity
-			if parent_state.route[-1].costTo(parent_state.route[0]) != math.inf:
-				solution = TSPSolution(parent_state.route)
+			if self._scenario.getCostMatrix()[parent_state.to_index, parent_state.start_index] != math.inf:
+				# follow the parent states back to the start to build the route
+				route = parent_state.get_route_indices()
+				solution = TSPSolution(route, self._scenario)
 				# if the cost of the solution is less than the solution we have saved, update it
-				if solution.cost < self.bssf.cost:
+				if solution.cost < self.bssf_cost():
 					self.bssf = solution
+					self.deadline.record(solution.cost, route)
+					# let the other workers prune against it too
+					if self._shared_bssf_cost is not None:
+						with self._shared_bssf_cost.get_lock():
+							if solution.cost < self._shared_bssf_cost.value:
+								self._shared_bssf_cost.value = solution.cost
 					# increment number of solutions found
 					self.number_of_solutions_found += 1
 					# prune states
 					self.prune()
+			return None
 
 		else:
-			# for all cities
-			for i in range(len(self._scenario.getCities())):
-				# if the city is not already part of the route
-				if i not in parent_state.route_set_indices:
-					# create new state
-					new_state = State(parent_state, i, self._scenario.getCities())
-					# increment number of states created
-					self.number_of_states_created += 1
-					# if the new state's lower bound is not infinity and is not more than bssf, then add it to the queue
-					if new_state.lower_bound != math.inf and new_state.lower_bound < self.bssf.cost:
-						new_state_key = new_state.get_key()
-						heapq.heappush(self.heap_list, (new_state.get_key(), new_state))
-					# if the new state is not added to the queue, then it counts as "pruned"
-					else:
-						self.number_of_pruned_states += 1
+			children = []
+			# for all cities that are not already part of the route
+			for i in np.flatnonzero(~parent_state.visited):
+				# create new state
+				new_state = State(parent_state, i)
+				# increment number of states created
+				self.number_of_states_created += 1
+				# if the new state's lower bound is not more than bssf, tighten it and check again
+				if new_state.bound < self.bssf_cost():
+					self.bound_strategy.tighten(new_state, self.bssf_cost())
+				# if the new state's lower bound is not infinity and is not more than bssf, then add it to the queue
+				if new_state.bound != math.inf and new_state.bound < self.bssf_cost():
+					children.append(new_state)
+				# if the new state is not added to the queue, then it counts as "pruned"
+				else:
+					self.number_of_pruned_states += 1
+			# the children have their own copies of the matrix, and the parent is only
+			# kept around to rebuild their routes, so let go of its matrix
+			parent_state.matrix = None
+			parent_state.row_zeros = None
+			parent_state.column_zeros = None
+
+			dive_state = None
+			if dive and len(children) != 0:
+				dive_state = min(children, key=lambda child: child.bound)
+			for child in children:
+				if child is not dive_state:
+					heapq.heappush(self.heap_list, (child.get_key(), child))
+			return dive_state
+
+
+	# rebuild the queue once at least this fraction of it can no longer beat the bssf
+	PRUNE_STALE_FRACTION = 0.5
+	# number of queue entries looked at to estimate that fraction
+	PRUNE_SAMPLE_SIZE = 256
+
+	# stale states (lower bound >= bssf cost) are skipped as they are popped in branchAndBound,
+	# so we only filter the whole queue when enough of it has gone stale to be worth the O(queue) rebuild
+	def prune(self):
+		# estimate the stale fraction from evenly spaced entries of the queue
+		step = max(1, len(self.heap_list) // self.PRUNE_SAMPLE_SIZE)
+		sample = self.heap_list[::step]
+		if len(sample) == 0:
+			return
+		bssf_cost = self.bssf_cost()
+		stale = sum(1 for key, state in sample if state.bound >= bssf_cost)
+		if stale < self.PRUNE_STALE_FRACTION * len(sample):
+			return
+		# keep the states that can still beat the bssf and restore the heap invariant
+		kept = [entry for entry in self.heap_list if entry[1].bound < bssf_cost]
+		# increment the number of pruned states
+		self.number_of_pruned_states += len(self.heap_list) - len(kept)
+		heapq.heapify(kept)
+		self.heap_list = kept
 
 
-	def prune(self):
-		# for each tuple in the heap_list
-		for tuple in self.heap_list:
-			# extract the key and state object
-			key, state = tuple
-			# if the state's lower bound is greater than or equal to  the new bssf cost
-			if state.lower_bound >= self.bssf.cost:
-				# remove the tuple from the list
-				self.heap_list.remove(tuple)
-				# increment the number of pruned states
-				self.number_of_pruned_states += 1
+	''' <summary>
+		Exact solver by Held-Karp dynamic programming (see HeldKarp.py), for problems
+		of up to about 20 cities.  Bigger problems are refused, without a solution, when
+		the DP tables would take more than max_bytes (HELD_KARP_MAX_BYTES by default);
+		so are runs that do not finish within time_allowance.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of the optimal 
+		solution, time spent, number of solutions found (1, or 0 if there was no tour or
+		the problem was refused), the optimal solution, and the number of DP entries as
+		total states (None if the tables were not filled in, the problem being refused or
+		out of time).  memory is the number of bytes the tables take (or would have
+		taken).</returns> 
+	'''
+
+	HELD_KARP_MAX_BYTES = 2**30
+
+	def heldKarp( self, time_allowance=60.0, max_bytes=None ):
+		start_time = time.time()
+		deadline = self._new_deadline(start_time, time_allowance)
+		if max_bytes is None:
+			max_bytes = self.HELD_KARP_MAX_BYTES
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		memory = held_karp_bytes(ncities)
+
+		bssf = None
+		# the DP tables were filled in, i.e. the problem was neither refused nor out of time
+		filled = False
+		if memory <= max_bytes and ncities > 1:
+			cost, route = held_karp(self._scenario.getCostMatrix(), deadline)
+			if route is not None:
+				bssf = TSPSolution(route, self._scenario)
+				deadline.record(bssf.cost, route)
+			# with no route, held_karp either found there is no tour or ran out of time
+			filled = route is not None or not deadline.passed()
+
+		end_time = time.time()
+		results = {}
+		results['cost'] = bssf.cost if bssf else math.inf
+		results['time'] = end_time - start_time
+		results['count'] = 1 if bssf else 0
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = (2 ** (ncities - 1)) * (ncities - 1) if filled else None
+		results['pruned'] = None
+		results['memory'] = memory
+		results['trace'] = deadline.trace
+		return results
+
+
+	# the most of the time left that the solvers starting from a greedy tour give to greedy
+	GREEDY_START_FRACTION = 0.25
+
+	# Run greedy for a solver that starts from its tour, with at most GREEDY_START_FRACTION of the time
+	# left before deadline, and start deadline's anytime trace with greedy's.
+	# Returns greedy's solution, None if it found none.
+	def _greedy_start( self, deadline ):
+		greedy_start = deadline.elapsed()
+		greedy_results = self.greedy(self.GREEDY_START_FRACTION * deadline.remaining())
+		deadline.trace = [(greedy_start + elapsed, cost) for elapsed, cost in greedy_results['trace']]
+		return greedy_results['soln']
 
 
 	''' <summary>
@@ -328,47 +715,245 @@ class TSPSolver:
 		algorithm</returns> 
 	'''
 		
+	# number of nearest cities to try as new neighbors for each city in the local search
+	FANCY_NEIGHBORS = 10
+
+	# greedy followed by local search with 2-opt, Or-opt and 3-opt segment insertion moves,
+	# see LocalSearch.local_search.  The last two never walk a stretch of the tour backwards,
+	# which is what improves tours with asymmetric (Normal and Hard) costs
 	def fancy( self,time_allowance=60.0 ):
 		# start timer
 		start_time = time.time()
-		# call greedy
-		self.bssf = self.greedy()['soln']
-		# get cities
-		cities = self._scenario.getCities()
-		route_changed = True
-		while route_changed:
-			route_changed = False
-			for i in range(len(cities)):
-				for j in range(len(cities)):
-					if i != j:
-						new_solution = self.two_opt_swap(self.bssf, i, j)
-						if new_solution.cost < self.bssf.cost:
-							self.bssf = new_solution
-							route_changed = True
+		deadline = self._new_deadline(start_time, time_allowance)
+		self.bssf = self._greedy_start(deadline)
+		moves = 0
+		if self.bssf is not None and time.time() < deadline.end_time:
+			cost_matrix = self._scenario.getCostMatrix()
+			# work on the route as an array of city indices, only building a TSPSolution at the end
+			tour = Tour(self.bssf.indices, cost_matrix)
+			neighbors = neighbor_lists(cost_matrix, self.FANCY_NEIGHBORS)
+			# the cheapest edges into every city
+			incoming = neighbor_lists(cost_matrix.T, self.FANCY_NEIGHBORS)
+			moves = local_search(tour, neighbors, incoming, deadline)
+			self.bssf = TSPSolution(tour.route, self._scenario)
 
 		end_time = time.time()
 
 		results = {}
-		results['cost'] = self.bssf.cost
-		results['count'] = 0
+		results['cost'] = self.bssf.cost if self.bssf else math.inf
+		# every improving move is a new solution
+		results['count'] = moves
 		results['soln'] = self.bssf
 		results['time'] = end_time - start_time
 		results['max'] = 0
 		results['total'] = 0
 		results['pruned'] = 0
+		results['trace'] = deadline.trace
 
 		return results
 
 
+	''' <summary>
+		Iterated Lin-Kernighan, see LinKernighan.iterated_lin_kernighan: greedy, then
+		variable-depth chains of 2-opt moves together with Or-opt and segment insertion
+		moves, kicking the tour with random double bridges until time runs out.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
+		time spent to find best solution, total number of solutions found during search, the 
+		best solution found, and the number of kicks made.</returns> 
+	'''
 
-	def two_opt_swap(self, path, i, j):
-		swapped_path = path.route[:i] + path.route[i:j][::-1] + path.route[j:]
-		swapped_path_solution = TSPSolution(swapped_path)
-		return swapped_path_solution
+	# number of nearest cities tried as the new edge of every chain step
+	LIN_KERNIGHAN_NEIGHBORS = 8
 
+	def linKernighan( self, time_allowance=60.0, max_depth=MAX_DEPTH, max_kicks=None ):
+		start_time = time.time()
+		deadline = self._new_deadline(start_time, time_allowance)
+		self.bssf = self._greedy_start(deadline)
+		improvements = 0
+		kicks = 0
+		if self.bssf is not None and time.time() < deadline.end_time:
+			cost_matrix = self._scenario.getCostMatrix()
+			tour = Tour(self.bssf.indices, cost_matrix)
+			neighbors = neighbor_lists(cost_matrix, self.LIN_KERNIGHAN_NEIGHBORS)
+			incoming = neighbor_lists(cost_matrix.T, self.LIN_KERNIGHAN_NEIGHBORS)
+			improvements, kicks = iterated_lin_kernighan(tour, neighbors, incoming, deadline,
+														 max_depth=max_depth, max_kicks=max_kicks)
+			self.bssf = TSPSolution(tour.route, self._scenario)
 
+		end_time = time.time()
 
-		
+		results = {}
+		results['cost'] = self.bssf.cost if self.bssf else math.inf
+		results['count'] = improvements
+		results['soln'] = self.bssf
+		results['time'] = end_time - start_time
+		results['max'] = 0
+		results['total'] = 0
+		results['pruned'] = 0
+		results['kicks'] = kicks
+		results['trace'] = deadline.trace
+
+		return results
+
+
+	''' <summary>
+		Simulated annealing from the greedy tour, see SimulatedAnnealing.anneal.
+		cooling names one of SimulatedAnnealing.COOLING_SCHEDULES; the temperatures
+		are derived from the greedy tour unless given.  With max_moves the schedule
+		runs over that many moves tried instead of the time allowance.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
+		time spent to find best solution, total number of solutions found during search, the 
+		best solution found.  total is the number of moves tried.</returns> 
+	'''
+
+	# number of nearest cities the random moves pick new edges from
+	ANNEALING_NEIGHBORS = 10
+
+	def simulatedAnnealing( self, time_allowance=60.0, cooling='geometric', start_temperature=None,
+							end_temperature=None, max_moves=None ):
+		start_time = time.time()
+		deadline = self._new_deadline(start_time, time_allowance)
+		self.bssf = self._greedy_start(deadline)
+		improvements = 0
+		tried = 0
+		if self.bssf is not None and time.time() < deadline.end_time:
+			cost_matrix = self._scenario.getCostMatrix()
+			tour = Tour(self.bssf.indices, cost_matrix)
+			neighbors = neighbor_lists(cost_matrix, self.ANNEALING_NEIGHBORS)
+			incoming = neighbor_lists(cost_matrix.T, self.ANNEALING_NEIGHBORS)
+			improvements, tried, made = anneal(tour, neighbors, incoming, deadline, start_temperature,
+											   end_temperature, cooling, max_moves=max_moves)
+			self.bssf = TSPSolution(tour.route, self._scenario)
+
+		end_time = time.time()
+
+		results = {}
+		results['cost'] = self.bssf.cost if self.bssf else math.inf
+		results['count'] = improvements
+		results['soln'] = self.bssf
+		results['time'] = end_time - start_time
+		results['max'] = 0
+		results['total'] = tried
+		results['pruned'] = 0
+		results['trace'] = deadline.trace
+
+		return results
+
+
+	''' <summary>
+		Genetic algorithm, see Genetic.evolve.  The first population is the greedy tour,
+		mutated copies of it and random permutations.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
+		time spent to find best solution, total number of solutions found during search, the 
+		best solution found.  total is the number of tours evaluated.</returns> 
+	'''
+
+	def genetic( self, time_allowance=60.0, population_size=POPULATION_SIZE, mutation_rate=MUTATION_RATE,
+				 max_generations=None ):
+		start_time = time.time()
+		deadline = self._new_deadline(start_time, time_allowance)
+		cities = self._scenario.getCities()
+		cost_matrix = self._scenario.getCostMatrix()
+		ncities = len(cities)
+		greedy_solution = self._greedy_start(deadline)
+
+		# with no time left after greedy, only its tour gets scored
+		population = random_permutations(population_size if not deadline.passed() else 1, ncities)
+		if greedy_solution is not None:
+			greedy_route = greedy_solution.indices.copy()
+			# half of the population starts near the greedy tour
+			population[0] = greedy_route
+			copies = min(max(1, population_size // 2), len(population))
+			if copies > 1 and not deadline.passed():
+				population[1:copies] = mutate(np.tile(greedy_route, (copies - 1, 1)), rate=1.0)
+		improvements, generations, route, cost = evolve(population, cost_matrix, deadline, max_generations,
+														mutation_rate=mutation_rate)
+		self.bssf = TSPSolution(route, self._scenario) if route is not None else None
+		# the greedy tour is in the first population, so only a better tour is a new solution
+		if greedy_solution is not None:
+			improvements -= 1
+
+		end_time = time.time()
+
+		results = {}
+		results['cost'] = self.bssf.cost if self.bssf else math.inf
+		results['count'] = improvements
+		results['soln'] = self.bssf
+		results['time'] = end_time - start_time
+		results['max'] = 0
+		results['total'] = (generations + 1) * population_size
+		results['pruned'] = 0
+		results['generations'] = generations
+		results['trace'] = deadline.trace
+
+		return results
+
+
+	''' <summary>
+		Ant colony optimization, see AntColony.ant_colony.  The ants do not follow the
+		greedy tour, so they find tours on Hard problems where greedy runs into dead
+		ends; the greedy tour is only the best tour to beat, and what is returned if
+		the ants run out of time before they find anything better.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
+		time spent to find best solution, total number of solutions found during search, the 
+		best solution found.  total is the number of tours the ants built.</returns> 
+	'''
+
+	def antColony( self, time_allowance=60.0, ants=ANTS, alpha=ALPHA, beta=BETA, evaporation=EVAPORATION,
+				   max_iterations=None ):
+		start_time = time.time()
+		deadline = self._new_deadline(start_time, time_allowance)
+		greedy_solution = self._greedy_start(deadline)
+		greedy_route = greedy_solution.indices if greedy_solution is not None else None
+		improvements, iterations, route, cost = ant_colony(self._scenario.getCostMatrix(), deadline, ants, alpha,
+														   beta, evaporation, max_iterations, greedy_route)
+		self.bssf = TSPSolution(route, self._scenario) if cost < math.inf else None
+
+		end_time = time.time()
+
+		results = {}
+		results['cost'] = self.bssf.cost if self.bssf else math.inf
+		results['count'] = improvements
+		results['soln'] = self.bssf
+		results['time'] = end_time - start_time
+		results['max'] = 0
+		results['total'] = iterations * ants
+		results['pruned'] = 0
+		results['iterations'] = iterations
+		results['trace'] = deadline.trace
+
+		return results
 
 
 
+# parallelBranchAndBound worker processes each keep one solver for the scenario
+_worker_solver = None
+
+def _start_branch_and_bound_worker(scenario, bound_strategy, queue_settings, shared_bssf_cost):
+	global _worker_solver
+	_worker_solver = TSPSolver(None)
+	_worker_solver.setupWithScenario(scenario)
+	_worker_solver.bound_strategy = bound_strategy
+	_worker_solver.queue_limit, _worker_solver.overflow, _worker_solver.dive_every = queue_settings
+	_worker_solver._shared_bssf_cost = shared_bssf_cost
+
+# search the subtree under one state, returning the best route (if this worker improved on the shared bssf),
+# the counters for the states it created and its anytime trace
+def _branch_and_bound_worker(state, start_time, time_allowance):
+	solver = _worker_solver
+	solver.number_of_solutions_found = 0
+	solver.max_queue_size = 0
+	solver.number_of_states_created = 0
+	solver.number_of_pruned_states = 0
+	solver.bssf = None
+	solver.deadline = Deadline(start_time, time_allowance)
+	solver.start_queue(state)
+	solver.search_queue()
+	solver.drop_queue()
+	route = solver.bssf.indices.tolist() if solver.bssf else None
+	return route, solver.number_of_solutions_found, solver.max_queue_size, \
+		solver.number_of_states_created, solver.number_of_pruned_states, solver.deadline.trace